@@ -0,0 +1,240 @@
+import os
+import sys
+import time
+from collections import defaultdict
+from bs4 import BeautifulSoup
+
+# local import
+from Util import Util
+from Configuration import Configuration
+from StrUtil import StrUtil
+from WidgetUtil import WidgetUtil
+from WidgetFeatures import WidgetFeatures
+from WidgetIndex import WidgetIndex
+from WidgetExtractor import WidgetExtractor
+from ResourceParser import ResourceParser
+from SimBackend import SimBackend, LocalSimBackend
+from const import SA_INFO_FOLDER
+
+
+class Benchmark:
+    """Offline measurements on the recorded test_repo workload (no device required)"""
+
+    @staticmethod
+    def load_workload(config_ids=None):
+        """Return a list of (config, src_events, widgets) for the transfers in config.csv.
+        As a stand-in for Explorer.widget_db, widgets are the static widgets of the target app
+        and the widgets in the target app's own test case.
+        """
+        if not config_ids:
+            config_ids = [c['id'] for c in Configuration.load()]
+        aid_to_static = {}
+        workload = []
+        for cid in config_ids:
+            try:
+                config = Configuration(cid)
+                src_events = Util.load_events(cid, 'base_from', config.use_stopwords)
+                tgt_events = Util.load_events(cid, 'base_to', config.use_stopwords)
+            except AssertionError:  # missing test case
+                continue
+            aid_to = cid.split('-')[1]
+            if aid_to not in aid_to_static:
+                db = {}
+                for w in ResourceParser(os.path.join(SA_INFO_FOLDER, aid_to)).get_widgets():
+                    if w['activity']:
+                        db[WidgetUtil.get_widget_signature(w)] = WidgetFeatures.attach(w, config.use_stopwords)
+                aid_to_static[aid_to] = list(db.values())
+            widgets = aid_to_static[aid_to] + [e for e in tgt_events if e['class'] not in ['SYS_EVENT', 'EMPTY_EVENT']]
+            src_events = [e for e in src_events if e['class'] not in ['SYS_EVENT', 'EMPTY_EVENT']]
+            workload.append((config, src_events, widgets))
+        return workload
+
+    @staticmethod
+    def rank(workload):
+        """most_similar for each source event: {(config_id, src_idx): [(widget_idx, score), ...]}"""
+        res = {}
+        for config, src_events, widgets in workload:
+            idx = {id(w): i for i, w in enumerate(widgets)}
+            for i, src_event in enumerate(src_events):
+                similars = WidgetUtil.most_similar(src_event, widgets, config.use_stopwords,
+                                                   config.expand_btn_to_text, config.cross_check, batch=True)
+                res[(config.id, i)] = [(idx[id(w)], score) for w, score in similars]
+        return res
+
+    @staticmethod
+    def quantization(model_path, quantized_model_path, num_to_check=10):
+        """Largest weighted_sim deviation of a quantized model against the float32 model,
+        and whether the candidates Explorer validates (top num_to_check of most_similar) change
+        """
+        workload = Benchmark.load_workload()
+        SimBackend.instance = LocalSimBackend(model_path)
+        ref = Benchmark.rank(workload)
+        SimBackend.instance = LocalSimBackend(quantized_model_path)
+        quantized = Benchmark.rank(workload)
+        SimBackend.instance = None
+        max_diff, num_scored, num_score_mismatch = 0, 0, 0
+        changed = defaultdict(list)
+        for k, similars in ref.items():
+            scores, q_scores = dict(similars), dict(quantized[k])
+            num_scored += len(scores)
+            num_score_mismatch += len(set(scores.keys()).symmetric_difference(q_scores.keys()))
+            for w_idx in set(scores.keys()).intersection(q_scores.keys()):
+                max_diff = max(max_diff, abs(scores[w_idx] - q_scores[w_idx]))
+            if [w for w, _ in similars[:1]] != [w for w, _ in quantized[k][:1]]:
+                changed['top-1'].append(k)
+            if [w for w, _ in similars[:num_to_check]] != [w for w, _ in quantized[k][:num_to_check]]:
+                changed[f'top-{num_to_check}'].append(k)
+        print(f'{len(workload)} transfers, {len(ref)} source events, {num_scored} scored (src, widget) pairs')
+        print(f'Max score deviation: {max_diff}')
+        print(f'Widgets scored by only one of the models: {num_score_mismatch}')
+        for k in ['top-1', f'top-{num_to_check}']:
+            print(f'Source events with a different {k} ranking: {len(changed[k])} {changed[k][:10]}')
+
+    @staticmethod
+    def tokenization():
+        """Per-widget cost of the tokenization weighted_sim does for a (source event, candidate) pair:
+        tokenize + expand_text on every call vs. memoized StrUtil.tokens
+        """
+        attrs = ['resource-id', 'text', 'content-desc', 'parent_text', 'sibling_text']
+        jobs = []  # (s_type, s, use_stopwords, w_class)
+        num_pairs = 0
+        for config, src_events, widgets in Benchmark.load_workload():
+            for src_event in src_events:
+                for w in widgets:
+                    num_pairs += 1
+                    for widget in [src_event, w]:
+                        for attr in attrs:
+                            if attr in widget and widget[attr]:
+                                jobs.append((attr, widget[attr], config.use_stopwords, widget['class']))
+                        jobs.append(('Activity', widget['activity'], config.use_stopwords, None))
+
+        def uncached(s_type, s, use_stopwords, w_class):
+            res = StrUtil.tokenize(s_type, s, use_stopwords=use_stopwords)
+            return StrUtil.expand_text(w_class, s_type, res) if w_class is not None else res
+
+        StrUtil.tokens.cache_clear()
+        for name, fn in [('uncached', uncached), ('memoized', StrUtil.tokens)]:
+            start = time.perf_counter()
+            for job in jobs:
+                try:
+                    fn(*job)
+                except AssertionError:  # e.g., resource-id without any word
+                    pass
+            elapsed = time.perf_counter() - start
+            print(f'{name}: {elapsed:.3f} sec for {len(jobs)} strings, {elapsed / num_pairs * 1e6:.2f} us per widget')
+        print(StrUtil.tokens.cache_info())
+
+    @staticmethod
+    def top_k(k_values=(1, 10), batch=True):
+        """Time of most_similar with k vs. scoring and sorting all the candidates, and whether the results are
+        identical to the first k of the full result
+        """
+        workload = Benchmark.load_workload()
+        for k in [None] + list(k_values):
+            SimBackend.get().cache.clear()  # cold client cache for every run
+            start = time.perf_counter()
+            res = {}
+            for config, src_events, widgets in workload:
+                for i, src_event in enumerate(src_events):
+                    res[(config.id, i)] = WidgetUtil.most_similar(src_event, widgets, config.use_stopwords,
+                                                                  config.expand_btn_to_text, config.cross_check,
+                                                                  batch=batch, k=k)
+            elapsed = time.perf_counter() - start
+            if k is None:
+                full = res
+                print(f'all: {elapsed:.3f} sec')
+            else:
+                num_diff = sum(1 for key, similars in res.items() if similars != full[key][:k])
+                print(f'k={k}: {elapsed:.3f} sec, {num_diff} source events with a result different from all[:{k}]')
+
+    @staticmethod
+    def ann(shortlist_sizes=(8, 16, 32), k=10):
+        """Recall of the top k of most_similar over a WidgetIndex shortlist against scoring all the widgets.
+        The index of a transfer holds the widgets of the target app (always trained, however small)
+        """
+        workload = Benchmark.load_workload()
+        exhaustive = {}
+        shortlisted = {size: {} for size in shortlist_sizes}
+        for config, src_events, widgets in workload:
+            index = WidgetIndex(config.use_stopwords, min_train_size=0)
+            index.update((WidgetUtil.get_widget_signature(w) + f'!{i}', w) for i, w in enumerate(widgets))
+            for i, src_event in enumerate(src_events):
+                exhaustive[(config.id, i)] = WidgetUtil.most_similar(src_event, widgets, config.use_stopwords,
+                                                                     config.expand_btn_to_text, config.cross_check,
+                                                                     batch=True, k=k)
+                for size in shortlist_sizes:
+                    candidates = index.shortlist(src_event, size)
+                    shortlisted[size][(config.id, i)] = WidgetUtil.most_similar(
+                        src_event, candidates, config.use_stopwords, config.expand_btn_to_text, config.cross_check,
+                        batch=True, k=k)
+        num_widgets = sum(len(widgets) for _, _, widgets in workload) / max(len(workload), 1)
+        print(f'{len(workload)} transfers, {len(exhaustive)} source events, {num_widgets:.1f} widgets per transfer')
+        for size in shortlist_sizes:
+            num_relevant, num_found, num_top1 = 0, 0, 0
+            for key, similars in exhaustive.items():
+                ids = [id(w) for w, _ in similars]
+                found = [id(w) for w, _ in shortlisted[size][key]]
+                num_relevant += len(ids)
+                num_found += len(set(ids).intersection(found))
+                num_top1 += 1 if ids[:1] == found[:1] else 0
+            recall = num_found / num_relevant if num_relevant else 1
+            print(f'shortlist {size}: recall@{k} {recall:.3f}, same top-1 for {num_top1}/{len(exhaustive)}')
+
+    @staticmethod
+    def extraction(dom_paths, repeat=10):
+        """find_all_widgets' extraction from page sources (e.g., saved from driver.page_source):
+        the former BeautifulSoup find_all per widget class against the single pass of WidgetExtractor
+        """
+        doms = []
+        for path in dom_paths:
+            with open(path, encoding='utf-8') as f:
+                doms.append(f.read())
+
+        def soup_widgets(dom):
+            soup = BeautifulSoup(dom, 'lxml-xml')
+            return [WidgetUtil.get_widget_from_soup_element(e)
+                    for w_class in WidgetUtil.WIDGET_CLASSES for e in soup.find_all(attrs={'class': w_class})
+                    if e.get('enabled') == 'true']
+
+        def extracted_widgets(dom):
+            return WidgetExtractor(WidgetUtil.WIDGET_CLASSES, WidgetUtil.FEATURE_KEYS).extract(dom)
+
+        def run(f, dom):
+            try:
+                return f(dom)
+            except Exception as excep:  # e.g., KeyError for a widget right under the root element
+                return type(excep).__name__
+
+        num_diff = sum(1 for dom in doms if run(soup_widgets, dom) != run(extracted_widgets, dom))
+        for name, f in [('BeautifulSoup', soup_widgets), ('WidgetExtractor', extracted_widgets)]:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                for dom in doms:
+                    run(f, dom)
+            elapsed = (time.perf_counter() - start) / repeat
+            print(f'{name}: {elapsed:.3f} sec for {len(doms)} page sources')
+        print(f'{num_diff} page sources with different widgets')
+
+
+if __name__ == '__main__':
+    # python Benchmark.py quantization GoogleNews-vectors-negative300.kv GoogleNews-vectors-negative300-int8.kv
+    # python Benchmark.py tokenization
+    # python Benchmark.py top_k
+    # python Benchmark.py ann
+    # python Benchmark.py extraction page1.xml page2.xml
+    if len(sys.argv) == 4 and sys.argv[1] == 'quantization':
+        Benchmark.quantization(sys.argv[2], sys.argv[3])
+    elif len(sys.argv) == 2 and sys.argv[1] == 'tokenization':
+        Benchmark.tokenization()
+    elif len(sys.argv) == 2 and sys.argv[1] == 'top_k':
+        Benchmark.top_k()
+    elif len(sys.argv) == 2 and sys.argv[1] == 'ann':
+        Benchmark.ann()
+    elif len(sys.argv) >= 3 and sys.argv[1] == 'extraction':
+        Benchmark.extraction(sys.argv[2:])
+    else:
+        print('Usage: python Benchmark.py quantization MODEL_PATH QUANTIZED_MODEL_PATH\n'
+              '       python Benchmark.py tokenization\n'
+              '       python Benchmark.py top_k\n'
+              '       python Benchmark.py ann\n'
+              '       python Benchmark.py extraction DOM_PATH...')
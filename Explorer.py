@@ -12,19 +12,27 @@ from datetime import datetime
 # local import
 from Util import Util
 from StrUtil import StrUtil
+from SimBackend import SimBackend
 from Configuration import Configuration
 from Runner import Runner
 from WidgetUtil import WidgetUtil
+from PageModel import PageModel
+from WidgetDB import WidgetDB
+from WidgetRecord import WidgetRecord
 from CallGraphParser import CallGraphParser
 from ResourceParser import ResourceParser
-from const import SA_INFO_FOLDER, SNAPSHOT_FOLDER
+from WidgetIndex import WidgetIndex
+from FakeDriver import FakeDriver
+from const import SA_INFO_FOLDER, SNAPSHOT_FOLDER, W2V_BATCH, W2V_INDEX_SHORTLIST, W2V_LEXICAL_FIRST, RECORD_TRACE, \
+    TRACE_FOLDER
 
 
 class Explorer:
-    def __init__(self, config_id, appium_port='4723', udid=None):
+    def __init__(self, config_id, appium_port='4723', udid=None, driver=None):
         self.config = Configuration(config_id)
-        self.runner = Runner(self.config.pkg_to, self.config.act_to, self.config.no_reset, appium_port, udid)
-        self.src_events = Util.load_events(self.config.id, 'base_from')
+        self.runner = Runner(self.config.pkg_to, self.config.act_to, self.config.no_reset, appium_port, udid, driver,
+                             Explorer.get_trace_path(config_id))
+        self.src_events = Util.load_events(self.config.id, 'base_from', self.config.use_stopwords)
         self.tid = self.config.id
         self.current_src_index = 0
         self.tgt_events = []
@@ -35,14 +43,29 @@ class Explorer:
         self.rp = ResourceParser(os.path.join(SA_INFO_FOLDER, self.config.id.split('-')[1]))
         self.widget_db = self.generate_widget_db()
         self.cgp = CallGraphParser(os.path.join(SA_INFO_FOLDER, self.config.id.split('-')[1]))
-        self.invalid_events = defaultdict(list)
+        # src index -> {identity key (see WidgetUtil.get_identity_key): event}
+        self.invalid_events = defaultdict(dict)
         self.nearest_button_to_text = None
         self.idx_src_to_tgt = {}
-        self.skipped_match = defaultdict(list)
+        # src index -> {identity key: skipped tgt event}, also keyed by the event with the text it enters
+        self.skipped_match = defaultdict(dict)
+        self.mapped_index = None  # see check_mapped
         self.consider_naf_only_widget = False
 
+    @staticmethod
+    def get_trace_path(config_id):
+        # to record the device interactions of a transfer into, None if not recorded
+        if not RECORD_TRACE:
+            return None
+        os.makedirs(TRACE_FOLDER, exist_ok=True)
+        return os.path.join(TRACE_FOLDER, config_id + '.jsonl.gz')
+
+    def new_widget_db(self):
+        index = WidgetIndex(self.config.use_stopwords) if W2V_INDEX_SHORTLIST else None
+        return WidgetDB(self.config.use_stopwords, index)
+
     def generate_widget_db(self):
-        db = {}
+        db = self.new_widget_db()
         for w in self.rp.get_widgets():
             if w['activity']:
                 # the signature here has no 'clickable' and 'password', bcuz it's from static info
@@ -74,8 +97,8 @@ class Explorer:
             #     {'class': 'EMPTY_EVENT', 'score': 0, 'event_type': 'gui'}
             # ]
             # self.current_src_index = 2
-            self.invalid_events = defaultdict(list)
-            self.skipped_match = defaultdict(list)
+            self.invalid_events = defaultdict(dict)
+            self.skipped_match = defaultdict(dict)
             self.idx_src_to_tgt = {}
             is_explored = False
             while self.current_src_index < len(self.src_events):
@@ -94,7 +117,7 @@ class Explorer:
                     if prev_src_event['event_type'] == 'oracle' and src_event['event_type'] == 'gui' \
                             and WidgetUtil.is_equal(prev_src_event, src_event) \
                             and self.tgt_events[-1]['class'] != 'EMPTY_EVENT':
-                        tgt_event = deepcopy(self.tgt_events[-1])
+                        tgt_event = self.tgt_events[-1].copy()
                         if 'stepping_events' in tgt_event:
                             tgt_event['stepping_events'] = []
                         tgt_event['event_type'] = 'gui'
@@ -123,7 +146,7 @@ class Explorer:
                             self.tgt_events = []
                         else:
                             self.tgt_events = self.tgt_events[:self.idx_src_to_tgt[self.current_src_index - 1] + 1]
-                        self.invalid_events[self.current_src_index].append(deepcopy(invalid_event))
+                        self.add_invalid_event(self.current_src_index, invalid_event)
                         continue
 
                     self.cache_seen_widgets(dom, pkg, act)
@@ -134,16 +157,21 @@ class Explorer:
                         if not self.nearest_button_to_text:
                             tgt_event = Explorer.generate_empty_event(src_event['event_type'])
                         else:
-                            w_candidates = WidgetUtil.most_similar(self.nearest_button_to_text, self.widget_db.values(),
+                            num_to_check = 1  # we know the button exists, so no need to seek other similar ones
+                            w_candidates = WidgetUtil.most_similar(self.nearest_button_to_text,
+                                                                   self.get_candidates(self.nearest_button_to_text),
                                                                    self.config.use_stopwords,
                                                                    self.config.expand_btn_to_text,
-                                                                   self.config.cross_check)
-                            num_to_check = 1  # we know the button exists, so no need to seek other similar ones
+                                                                   self.config.cross_check,
+                                                                   batch=W2V_BATCH, k=num_to_check,
+                                                                   lexical_first=W2V_LEXICAL_FIRST)
                     else:
-                        w_candidates = WidgetUtil.most_similar(src_event, self.widget_db.values(),
+                        w_candidates = WidgetUtil.most_similar(src_event, self.get_candidates(src_event),
                                                                self.config.use_stopwords,
                                                                self.config.expand_btn_to_text,
-                                                               self.config.cross_check)
+                                                               self.config.cross_check,
+                                                               batch=W2V_BATCH, k=num_to_check,
+                                                               lexical_first=W2V_LEXICAL_FIRST)
 
                     # if w_candidates:
                     #     w_candidates = self.decay_by_distance(w_candidates, pkg, act)
@@ -151,7 +179,7 @@ class Explorer:
                         # encode-decode: for some weird chars in a1 apps
                         print(f'({i+1}/{num_to_check}) Validating Similar w: {w}'.encode("utf-8").decode("utf-8"))
                         # skip invalid events
-                        if any([WidgetUtil.is_equal(w, e) for e in self.invalid_events.get(self.current_src_index, [])]):
+                        if WidgetUtil.get_identity_key(w) in self.invalid_events.get(self.current_src_index, {}):
                             print('Skip a known broken event:', w)
                             continue
                         # skip widget with empty attribute if the action is wait_until with the attribute; a33-a35-b31
@@ -195,7 +223,7 @@ class Explorer:
                                         print(f'Duplicated match. Backtrack to src_idx: {src_idx} to find another match')
                                         backtrack = True
                                         self.current_src_index = src_idx
-                                        self.skipped_match[src_idx].append(deepcopy(self.tgt_events[tgt_idx]))
+                                        self.add_skipped_match(src_idx, self.tgt_events[tgt_idx])
                                         # pop tgt_events
                                         if src_idx == 0:
                                             self.tgt_events = []
@@ -242,6 +270,12 @@ class Explorer:
             print(f'Current target events with fitness {self.f_target}:')
             for t in self.tgt_events:
                 print(t)
+            print('Similarity queries:', SimBackend.get().stats())
+            print('Page sources:', PageModel.stats())
+            print('GUI states:', WidgetUtil.state_to_widgets.stats())
+            print('UI settle waits:', self.runner.settler.stats())
+            print('State restores:', self.runner.restorer.stats())
+            print('Device queries:', self.runner.query_stats())
             self.snapshot()
 
             # if self.f_target == 0 (all events in self.tgt_events are EMPTY_EVENT)
@@ -315,12 +349,18 @@ class Explorer:
             self.widget_db[w_signature] = w
         # print('** after:', self.widget_db)
 
+    def get_candidates(self, src_event):
+        # the widgets of widget_db to score for src_event
+        if self.widget_db.index is not None:
+            return self.widget_db.shortlist(src_event, W2V_INDEX_SHORTLIST)
+        return self.widget_db
+
     def execute_target_events(self, stepping_events):
         src_event = self.src_events[self.current_src_index]
         require_wait = src_event['action'][0].startswith('wait_until')
         # require_wait = True
         # if self.is_rerun_required:
-        self.runner.perform_actions(self.tgt_events, require_wait, reset=True, cgp=self.cgp)
+        self.runner.restore(self.tgt_events, require_wait, cgp=self.cgp)
         # elif not self.is_rerun_required and self.tgt_events:
         #     # no reset and rerun, just execute the last matched action
         #     self.runner.perform_actions([self.tgt_events[-1]], require_wait, reset=False, cgp=self.cgp)
@@ -351,7 +391,7 @@ class Explorer:
 
     @staticmethod
     def generate_empty_event(event_type):
-        return {"class": "EMPTY_EVENT", 'score': 0, 'event_type': event_type}
+        return WidgetRecord({"class": "EMPTY_EVENT", 'score': 0, 'event_type': event_type})
 
     def check_reachability(self, w, current_pkg, current_act):
         # print(f'Validating Similar w: {w}')
@@ -478,27 +518,73 @@ class Explorer:
     def __getstate__(self):
         state = self.__dict__.copy()        
         del state['runner']
+        state.pop('mapped_index', None)
         return state
     
     def __setstate__(self, state):        
         self.__dict__.update(state)        
         self.runner = None
+        self.mapped_index = None
+        # snapshots from before the identity keys have lists of events
+        invalid_events, skipped_match = self.invalid_events, self.skipped_match
+        self.invalid_events, self.skipped_match = defaultdict(dict), defaultdict(dict)
+        for src_idx, events in invalid_events.items():
+            for e in (events.values() if isinstance(events, dict) else events):
+                self.add_invalid_event(src_idx, e)
+        for src_idx, events in skipped_match.items():
+            for e in (events.values() if isinstance(events, dict) else events):
+                self.add_skipped_match(src_idx, e)
+        # snapshots from before WidgetDB have a dict of widgets (and maybe a separate widget_index)
+        self.__dict__.pop('widget_index', None)
+        if not isinstance(self.widget_db, WidgetDB):
+            widgets, self.widget_db = self.widget_db, self.new_widget_db()
+            for w_signature, w in widgets.items():
+                self.widget_db[w_signature] = w if isinstance(w, WidgetRecord) else WidgetRecord.from_dict(w)
     
     def snapshot(self):
         with open(os.path.join(SNAPSHOT_FOLDER, self.config.id + '.pkl'), 'wb') as f:
             pickle.dump(self, f)
 
-    def check_mapped(self, match):
-        tgt_idx = -1
-        for i, e in enumerate(self.tgt_events):
+    def add_invalid_event(self, src_idx, event):
+        key = WidgetUtil.get_identity_key(event)
+        if key is not None:  # an empty event is equal to no widget
+            self.invalid_events[src_idx][key] = WidgetRecord.freeze(event)
+
+    def add_skipped_match(self, src_idx, event):
+        event = WidgetRecord.freeze(event)
+        for key in self.get_typed_keys(event):
+            self.skipped_match[src_idx][key] = event
+
+    @staticmethod
+    def get_typed_keys(e):
+        """Identity keys of an event, and of the event with its text replaced by the text it enters (send_keys)"""
+        keys = [WidgetUtil.get_identity_key(e)]
+        if 'action' in e and len(e['action']) > 1:
+            e_new_text = e.copy()
+            e_new_text['text'] = e['action'][1]
+            keys.append(WidgetUtil.get_identity_key(e_new_text))
+        return [key for key in keys if key is not None]
+
+    def get_mapped_index(self):
+        """{identity key: index of the first EditText event entering text in tgt_events} (see get_typed_keys).
+        tgt_events is only appended to or replaced by a new list, so the index is extended with the new events,
+        or built again for a new list.
+        """
+        if self.mapped_index is None or self.mapped_index[0] is not self.tgt_events:
+            self.mapped_index = [self.tgt_events, 0, {}]
+        events, num_indexed, index = self.mapped_index
+        for i in range(num_indexed, len(events)):
+            e = events[i]
             if e['class'] != 'android.widget.EditText' or 'send_keys' not in e['action'][0]:
                 continue
-            e_tgt_new_text = deepcopy(e)
-            e_tgt_new_text['text'] = e_tgt_new_text['action'][1]
-            # todo: ensure that e and match are on the same screen
-            if WidgetUtil.is_equal(match, e) or WidgetUtil.is_equal(match, e_tgt_new_text):
-                tgt_idx = i
-                break
+            for key in Explorer.get_typed_keys(e):
+                index.setdefault(key, i)
+        self.mapped_index[1] = len(events)
+        return index
+
+    def check_mapped(self, match):
+        # todo: ensure that e and match are on the same screen
+        tgt_idx = self.get_mapped_index().get(WidgetUtil.get_identity_key(match), -1)
         if tgt_idx == -1:
             return False, -1, -1
         else:
@@ -511,12 +597,7 @@ class Explorer:
             return True, tgt_idx, src_idx
 
     def check_skipped(self, match):
-        for skipped in self.skipped_match[self.current_src_index]:
-            skipped_new_text = deepcopy(skipped)
-            skipped_new_text['text'] = skipped_new_text['action'][1]
-            if WidgetUtil.is_equal(match, skipped) or WidgetUtil.is_equal(match, skipped_new_text):
-                return True
-        return False
+        return WidgetUtil.get_identity_key(match) in self.skipped_match[self.current_src_index]
 
     def check_identical_src_widgets(self, src_idx1, src_idx2):
         """ True: treat two src widgets as the same, i.e., not to check identical mapping.
@@ -531,9 +612,9 @@ class Explorer:
             if self.is_for_email_or_pwd(src_e1, src_e2):
                 return True
             else:
-                w1 = deepcopy(src_e1)
+                w1 = src_e1.copy()
                 w1['text'] = ''
-                w2 = deepcopy(src_e2)
+                w2 = src_e2.copy()
                 w2['text'] = ''
                 return WidgetUtil.is_equal(w1, w2)
         else:
@@ -575,11 +656,21 @@ class Explorer:
 
 if __name__ == '__main__':
     # python Explorer.py a25-a22-b21 1 5723 emulator-5556 2>&1 | tee log\1-step\a25-a22-b21.txt
+    # without a device: python Explorer.py a21-a22-b21 --fake DOM_FOLDER (recorded page sources, see FakeDriver.py)
+    #                   python Explorer.py a21-a22-b21 --replay trace/a21-a22-b21.jsonl.gz (see RecordingDriver.py)
+    driver = None
     if len(sys.argv) > 1:
         config_id = sys.argv[1]
         # lookahead_step = int(sys.argv[2])
         appium_port = sys.argv[2]
         udid = sys.argv[3]
+        if appium_port == '--fake':
+            config = Configuration(config_id)
+            apk_folder = os.path.join(SA_INFO_FOLDER, config_id.split('-')[1])
+            driver = FakeDriver.from_folder(udid, config.pkg_to, config.act_to, CallGraphParser(apk_folder),
+                                            ResourceParser(apk_folder), config.no_reset)
+        elif appium_port == '--replay':
+            driver = FakeDriver.from_trace(udid, Configuration(config_id).no_reset)
     else:
         config_id = 'a33-a35-b31'
         # lookahead_step = 1
@@ -613,11 +704,12 @@ if __name__ == '__main__':
             print(explorer.skipped_match)
             print(explorer.nearest_button_to_text)
             # input()
-            explorer.runner = Runner(explorer.config.pkg_to, explorer.config.act_to, explorer.config.no_reset, appium_port, udid)
+            explorer.runner = Runner(explorer.config.pkg_to, explorer.config.act_to, explorer.config.no_reset, appium_port, udid,
+                                     driver, Explorer.get_trace_path(config_id))
             # explorer.f_target = 0.55
 
     else:
-        explorer = Explorer(config_id, appium_port, udid)
+        explorer = Explorer(config_id, appium_port, udid, driver)
 
     t_start = time.time()
     # explorer.mutate_src_action({'long_press': 'swipe_right', 'swipe_right': 'long_press'})
@@ -0,0 +1,394 @@
+import os
+import re
+import glob
+import lxml.etree
+from appium.webdriver.common.appiumby import AppiumBy as MobileBy
+from selenium.common.exceptions import NoSuchElementException, WebDriverException
+from appium.webdriver.mobilecommand import MobileCommand
+# local import
+from StrUtil import StrUtil
+from RecordingDriver import RecordingDriver
+
+
+class FakeElement:
+    """An element of the current screen of a FakeDriver, with the WebElement methods used by Runner"""
+
+    def __init__(self, screen, e, element_id):
+        self.screen = screen
+        self.e = e
+        self.id = element_id
+
+    def get_attribute(self, name):
+        return self.e.get(name)
+
+    @property
+    def text(self):
+        return self.e.get('text', '')
+
+    @property
+    def rect(self):
+        x1, y1, x2, y2 = FakeDriver.get_bounds(self.e)
+        return {'x': x1, 'y': y1, 'width': x2 - x1, 'height': y2 - y1}
+
+    def is_displayed(self):
+        return True
+
+    def is_enabled(self):
+        return self.e.get('enabled') == 'true'
+
+    def click(self):
+        self.screen.driver.perform(self, 'click')
+
+    def clear(self):
+        self.screen.set_text(self.e, '')
+
+    def send_keys(self, value):
+        self.screen.set_text(self.e, value)
+
+
+class FakeScreen:
+    """An instance of a recorded screen; entering text changes its page source"""
+
+    def __init__(self, driver, name, dom):
+        self.driver = driver
+        self.name = name
+        self.dom = dom
+        self.root = None  # parsed when an element is needed
+        self.is_modified = False
+        self.elements = {}  # element id -> FakeElement
+
+    def get_root(self):
+        if self.root is None:
+            self.root = lxml.etree.fromstring(self.dom.encode('utf-8'))
+        return self.root
+
+    def get_page_source(self):
+        if self.is_modified:
+            self.dom = lxml.etree.tostring(self.root, encoding='UTF-8', xml_declaration=True,
+                                           standalone=True).decode('utf-8')
+            self.is_modified = False
+        return self.dom
+
+    def find_elements(self, by, value):
+        if by == MobileBy.ID:
+            es = self.get_root().xpath('//*[@resource-id=$v]', v=value)
+        elif by == MobileBy.ACCESSIBILITY_ID:
+            es = self.get_root().xpath('//*[@content-desc=$v]', v=value)
+        elif by == MobileBy.XPATH:
+            es = self.get_root().xpath(value)
+        else:
+            raise WebDriverException(f'Unsupported locator strategy: {by}')
+        return [self.get_element(e) for e in es if isinstance(e, lxml.etree._Element)]
+
+    def get_element(self, e):
+        element_id = f'{self.name}:{self.get_root().getroottree().getpath(e)}'
+        if element_id not in self.elements:
+            self.elements[element_id] = FakeElement(self, e, element_id)
+        return self.elements[element_id]
+
+    def get_element_at(self, x, y):
+        # the innermost element whose bounds contain (x, y)
+        found = None
+        for e in self.get_root().iter():
+            bounds = FakeDriver.get_bounds(e)
+            if bounds and bounds[0] <= x < bounds[2] and bounds[1] <= y < bounds[3]:
+                found = e
+        return self.get_element(found) if found is not None else None
+
+    def set_text(self, e, text):
+        e.set('text', text)
+        self.is_modified = True
+
+
+class FakeDriver:
+    """In-process stand-in for the Appium driver of Runner (Runner(..., driver=FakeDriver(...))), to run Explorer
+    without a device, e.g., to profile or regression-test a transfer.
+    The app is a set of recorded screens (page sources) and transitions between them: a click or long_press on a
+    widget matching the criteria of a transition from the current screen enters another screen (a new instance of
+    it, on top of a back stack), any other action stays on the current screen. Entering text changes the text of
+    the element. KEY_BACK leaves the current screen, and the app (to the launcher) from the first one.
+    Transitions come from the edges of a CallGraphParser (see from_folder), or from a trace (see from_trace).
+    """
+    LAUNCHER_PACKAGE = 'com.android.launcher3'
+    LAUNCHER_ACTIVITY = '.Launcher'
+    LAUNCHER_DOM = "<?xml version='1.0' encoding='UTF-8' standalone='yes' ?><hierarchy rotation=\"0\" />"
+    BOUNDS_RE = re.compile(r'\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]')
+    # commands of a trace which may change the screen
+    TRACE_ACTIONS = ['click', 'long_press', 'tap', 'send_keys', 'clear', 'swipe', 'press_keycode', 'activate_app',
+                     'terminate_app', 'clear_app']
+
+    def __init__(self, pkg, start_screen, screens, transitions, no_reset=False, activities=None):
+        """screens: {name: page source}, the name is the full activity name unless in activities;
+        transitions: [(from screen, criteria (a dict of WidgetUtil.FEATURE_KEYS), action, to screen)];
+        activities: {screen: (package, activity as the driver reports it)}
+        """
+        self.pkg = pkg
+        self.start_screen = start_screen
+        self.screens = screens
+        self.transitions = transitions
+        self.activities = activities if activities else {}
+        self.desired_capabilities = {'desired': {'noReset': no_reset}, 'appPackage': pkg, 'appActivity': start_screen}
+        self.back_stack = []  # FakeScreen, the current one on top; empty if the app is not running
+        self.num_commands = 0
+
+    @staticmethod
+    def from_folder(dom_folder, pkg, act, cgp, rp=None, no_reset=False):
+        """A fake app of the page sources recorded in dom_folder, one per activity (e.g., <dom_folder>/
+        com.rubenroy.minimaltodo.MainActivity.xml), with the transitions of the edges of cgp between them:
+        dynamic ones (D@criteria) and static ones (GUI (oId), by the resource-id of oId from the ResourceParser rp)
+        """
+        screens = {}
+        for fpath in sorted(glob.glob(os.path.join(dom_folder, '*.xml'))):
+            with open(fpath, encoding='utf-8') as f:
+                screens[os.path.basename(fpath)[:-len('.xml')]] = f.read()
+        transitions = []
+        for u, v, attrs in cgp.G.edges(data=True):
+            criteria = FakeDriver.get_criteria(attrs.get('label', ''), rp)
+            act_from, act_to = StrUtil.get_activity(u), StrUtil.get_activity(v)
+            if criteria is not None and act_from in screens:
+                method = StrUtil.get_method(v) if ': ' in v else ''
+                action = 'long_press' if 'onLongClick' in attrs['label'] or 'LongClick' in method else 'click'
+                transitions.append((act_from, criteria, action, act_to if act_to in screens else act_from))
+        start_screen = pkg + act if act.startswith('.') else act
+        return FakeDriver(pkg, start_screen, screens, transitions, no_reset)
+
+    @staticmethod
+    def from_trace(trace_path, no_reset=False):
+        """A fake app of the pages recorded in a trace (see RecordingDriver), each page a screen, with the transitions
+        observed: a click, long_press or tap on the page of a screen followed by the page of another one (without
+        other actions in between). Entering text in a page gives another page of the same screen.
+        """
+        doms = {}  # digest -> page source
+        activities = {}  # digest -> (package, activity)
+        observed = []  # (from page, action record, to page)
+        pkg, act, start_screen = None, None, None
+        page, package, activity = None, None, None  # observed since the last action
+        pending = None  # (page, action record): the only action since the last observed page
+        is_launched = False  # the app was just activated
+        for record in RecordingDriver.read_trace(trace_path):
+            if 'session' in record:
+                if pkg is None:
+                    pkg, act = record['session']['pkg'], record['session']['act']
+                page, package, activity, pending, is_launched = None, None, None, None, False
+                continue
+            elif 'page' in record:
+                doms[record['page']] = record['dom']
+                continue
+            cmd = record.get('cmd')
+            if cmd in FakeDriver.TRACE_ACTIONS:
+                pending = (page, record) if page is not None and 'error' not in record else None
+                page, package, activity = None, None, None
+                is_launched = cmd == 'activate_app'
+                continue
+            if 'error' in record:
+                continue
+            if cmd == 'page_source':
+                page = record['result']
+                if pending is not None:
+                    observed.append((pending[0], pending[1], page))
+                    pending = None
+                if is_launched and start_screen is None:
+                    start_screen = page
+            elif cmd == 'current_package':
+                package = record['result']
+            elif cmd == 'current_activity':
+                activity = record['result']
+            if page is not None and package is not None and activity is not None:
+                activities[page] = (package, activity)
+
+        aliases = {}  # page with text entered -> page of the same screen
+
+        def screen(page):
+            while page in aliases:
+                page = aliases[page]
+            return page
+
+        for page_from, record, page_to in observed:
+            if record['cmd'] in ['send_keys', 'clear'] and page_to not in aliases and screen(page_from) != page_to:
+                aliases[page_to] = page_from
+
+        transitions = {}
+        for page_from, record, page_to in observed:
+            if record['cmd'] not in ['click', 'long_press', 'tap'] or screen(page_from) == screen(page_to):
+                continue
+            criteria = FakeDriver.get_trace_criteria(doms[page_from], record)
+            if criteria is not None:
+                action = 'long_press' if record['cmd'] == 'long_press' else 'click'
+                key = (screen(page_from), tuple(sorted(criteria.items())), action)
+                transitions.setdefault(key, screen(page_to))  # the first one observed
+        screens = {screen(page): doms[screen(page)] for page in doms}
+        activities = {page: a for page, a in activities.items() if page == screen(page)}
+        for name in screens:
+            activities.setdefault(name, (pkg, act))
+        if start_screen is None and doms:  # the app was not launched in the trace
+            start_screen = next(iter(doms))
+        return FakeDriver(pkg, screen(start_screen), screens,
+                          [(s_from, dict(criteria), action, s_to)
+                           for (s_from, criteria, action), s_to in transitions.items()], no_reset, activities)
+
+    @staticmethod
+    def get_trace_criteria(dom, record):
+        # criteria of the element of an action record on the page dom, None if not found
+        screen = FakeScreen(None, '', dom)
+        try:
+            if record['cmd'] == 'tap':
+                x, y = record['args'][0][0]
+                element = screen.get_element_at(x, y)
+            else:
+                by, value, index = record['element']
+                elements = screen.find_elements(by, value)
+                element = elements[index] if index < len(elements) else None
+        except (TypeError, ValueError, WebDriverException, lxml.etree.Error):  # e.g., no locator
+            return None
+        return FakeDriver.get_widget(element.e) if element else None
+
+    @staticmethod
+    def get_criteria(label, rp=None):
+        # criteria of the widget of a CallGraphParser edge, None if not a GUI event
+        label = label.strip('"')
+        if label.startswith('D@'):
+            # e.g., D@class=android.widget.TextView&content-desc=&naf=&resource-id=create&text=Create (onClick)
+            criteria = {}
+            last_key = None
+            for kvp in ' '.join(label[2:].split()[:-1]).split('&'):
+                if '=' in kvp:
+                    last_key, v = kvp.split('=', 1)
+                    criteria[last_key] = v
+                elif last_key:  # '&' in a value, as CallGraphParser.is_naf_only_widget
+                    criteria[last_key] += '&' + kvp
+            return criteria
+        m = re.match(r'GUI \((.+)\)', label)
+        if m and m.group(1) != 'NULL':
+            oId = m.group(1)
+            w_name = rp.get_wName_from_oId(oId) if rp else None
+            return {'resource-id': w_name if w_name else oId}
+        return None
+
+    @staticmethod
+    def get_bounds(e):
+        m = FakeDriver.BOUNDS_RE.match(e.get('bounds', ''))
+        return tuple(int(v) for v in m.groups()) if m else None
+
+    @staticmethod
+    def get_widget(e):
+        # the values of WidgetUtil.FEATURE_KEYS (except clickable and password), as WidgetUtil.find_all_widgets
+        w_class = e.get('class', '').split()
+        return {
+            'class': w_class[0] if w_class else '',
+            'resource-id': e.get('resource-id', '').split('/')[-1],
+            'text': e.get('text', ''),
+            'content-desc': e.get('content-desc', ''),
+            'naf': e.get('naf', ''),
+        }
+
+    def get_activity(self, name):
+        # (package, activity) of a screen
+        if name in self.activities:
+            return self.activities[name]
+        return self.pkg, name[len(self.pkg):] if name.startswith(self.pkg + '.') else name
+
+    def get_screen(self):
+        if not self.back_stack:
+            raise WebDriverException('The app is not running')
+        return self.back_stack[-1]
+
+    def enter(self, name):
+        self.back_stack.append(FakeScreen(self, name, self.screens[name]))
+
+    def perform(self, element, action):
+        """A click or long_press on an element of the current screen"""
+        self.num_commands += 1
+        screen = self.get_screen()
+        if element.screen is not screen:
+            raise WebDriverException('The element is not on the current screen (stale element)')
+        w = FakeDriver.get_widget(element.e)
+        for act_from, criteria, transition_action, act_to in self.transitions:
+            if act_from == screen.name and transition_action == action \
+                    and all(w.get(k, '') == v for k, v in criteria.items() if k in w):
+                if act_to != screen.name:
+                    self.enter(act_to)
+                return
+
+    # the Appium driver methods used by Runner
+    @property
+    def page_source(self):
+        self.num_commands += 1
+        if not self.back_stack:
+            return FakeDriver.LAUNCHER_DOM
+        return self.get_screen().get_page_source()
+
+    @property
+    def current_package(self):
+        self.num_commands += 1
+        if not self.back_stack:
+            return FakeDriver.LAUNCHER_PACKAGE
+        return self.get_activity(self.get_screen().name)[0]
+
+    @property
+    def current_activity(self):
+        self.num_commands += 1
+        if not self.back_stack:
+            return FakeDriver.LAUNCHER_ACTIVITY
+        return self.get_activity(self.get_screen().name)[1]
+
+    def find_elements(self, by=MobileBy.ID, value=None):
+        self.num_commands += 1
+        return self.get_screen().find_elements(by, value)
+
+    def find_element(self, by=MobileBy.ID, value=None):
+        elements = self.find_elements(by, value)
+        if not elements:
+            raise NoSuchElementException(f'No element by {by}: {value}')
+        return elements[0]
+
+    def activate_app(self, app_id):
+        self.num_commands += 1
+        if not self.back_stack:
+            self.enter(self.start_screen)
+
+    def terminate_app(self, app_id):
+        self.num_commands += 1
+        self.back_stack = []
+        return True
+
+    def clear_app(self, app_id):
+        # adb shell pm clear: the recorded screens have no app data
+        self.terminate_app(app_id)
+
+    def press_keycode(self, keycode, metastate=None, flags=None):
+        self.num_commands += 1
+        if keycode == 4 and self.back_stack:  # AndroidKeyCode for 'Back'; leaves the app from the first screen
+            self.back_stack.pop()
+        # others (e.g., 66: Enter) don't change the screen
+
+    def is_keyboard_shown(self):
+        return False
+
+    def hide_keyboard(self, key_name=None, key=None, strategy=None):
+        self.num_commands += 1
+        raise WebDriverException('Soft keyboard not present, cannot hide keyboard')  # as a device, see is_keyboard_shown
+
+    def tap(self, positions, duration=None):
+        x, y = positions[0]
+        element = self.get_screen().get_element_at(x, y)
+        if element:
+            element.click()
+
+    def swipe(self, start_x, start_y, end_x, end_y, duration=0):
+        self.num_commands += 1
+
+    def execute(self, driver_command, params=None):
+        # TouchAction(driver).long_press(ele).perform()
+        if driver_command == MobileCommand.TOUCH_ACTION:
+            for a in params['actions']:
+                if a['action'] == 'longPress' and 'element' in a.get('options', {}):
+                    element_id = a['options']['element']
+                    element = self.get_screen().elements.get(element_id)
+                    if element is None:
+                        raise WebDriverException(f'No such element: {element_id}')
+                    self.perform(element, 'long_press')
+            return {'value': None}
+        raise WebDriverException(f'Unsupported command: {driver_command}')
+
+    def quit(self):
+        self.terminate_app(self.pkg)
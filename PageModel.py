@@ -0,0 +1,134 @@
+import hashlib
+import re
+import time
+import xml.etree.ElementTree as ET
+import lxml.etree
+from collections import OrderedDict, defaultdict
+from bs4 import BeautifulSoup
+# local import
+from WidgetExtractor import WidgetExtractor
+
+
+class PageTreeBuilder:
+    """lxml parser target building the same elements as BeautifulSoup's 'lxml-xml' parser from a page source
+    (a plain lxml parse recovers from malformed sources differently). The root is a 'document' element without
+    attributes, which stands for the BeautifulSoup object, so a page with several top-level elements has one tree.
+    """
+    DOCUMENT = 'document'
+
+    def __init__(self):
+        self.builder = None
+        self.tags = []  # of the open elements
+        self.reset()
+
+    def reset(self):
+        self.builder = lxml.etree.TreeBuilder()
+        self.builder.start(PageTreeBuilder.DOCUMENT, {})
+        self.tags = []
+
+    def start(self, tag, attrib, nsmap=None):
+        self.builder.start(tag, attrib)
+        self.tags.append(tag)
+
+    def end(self, tag):
+        self.builder.end(self.tags.pop())
+
+    def close(self):
+        while self.tags:  # e.g., a truncated page source
+            self.end(None)
+        self.builder.end(PageTreeBuilder.DOCUMENT)
+        return self.builder.close()
+
+
+class PageModel:
+    """A page source (driver.page_source) parsed once and shared by the WidgetUtil queries about it
+    (get_gui_signature, find_all_widgets, locate_widget, get_nearest_button, get_attrs).
+    Page models are cached by content hash in a bounded LRU, since e.g. Explorer.validate_path gets the page source
+    of the same screen several times per hop. Each parser only runs when a query needs it, and the results of
+    the queries are memoized (callers get copies of the widgets, which they modify).
+    """
+    cache = OrderedDict()  # content hash -> PageModel
+    cache_size = 32
+    num_hits = 0
+    num_misses = 0
+    parse_counts = defaultdict(int)  # parser -> number of parses
+    parse_times = defaultdict(float)  # parser -> total time in sec
+
+    def __init__(self, dom, digest=None):
+        self.dom = dom
+        self.digest = digest if digest else PageModel.hash(dom)
+        self.tree = None  # ElementTree root, for the signature
+        self.element_tree = None  # PageTreeBuilder root, for lxml queries
+        self.soup = None
+        self.memo = {}  # query -> result
+
+    @staticmethod
+    def hash(dom):
+        return hashlib.sha1(dom.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def of(cls, dom):
+        """The page model of a page source (or the page model itself)"""
+        if isinstance(dom, PageModel):
+            return dom
+        digest = PageModel.hash(dom)
+        if digest in cls.cache:
+            cls.cache.move_to_end(digest)
+            cls.num_hits += 1
+            return cls.cache[digest]
+        cls.num_misses += 1
+        page = PageModel(dom, digest)
+        cls.cache[digest] = page
+        if len(cls.cache) > cls.cache_size:
+            cls.cache.popitem(last=False)
+        return page
+
+    @classmethod
+    def clear(cls):
+        cls.cache.clear()
+
+    @classmethod
+    def timed_parse(cls, parser, parse, *args):
+        start = time.perf_counter()
+        try:
+            return parse(*args)
+        finally:
+            cls.parse_counts[parser] += 1
+            cls.parse_times[parser] += time.perf_counter() - start
+
+    def get_tree(self):
+        if self.tree is None:
+            xml_dom = re.sub(r'&#\d+;', "", self.dom)  # remove emoji
+            self.tree = PageModel.timed_parse('ElementTree', ET.fromstring, xml_dom)
+        return self.tree
+
+    def get_element_tree(self):
+        if self.element_tree is None:
+            self.element_tree = PageModel.timed_parse('PageTreeBuilder', WidgetExtractor.feed, PageTreeBuilder(),
+                                                      self.dom)
+        return self.element_tree
+
+    def get_soup(self):
+        if self.soup is None:
+            self.soup = PageModel.timed_parse('BeautifulSoup', BeautifulSoup, self.dom, 'lxml-xml')
+        return self.soup
+
+    def get_widgets(self, widget_classes, feature_keys):
+        """Copies of the widgets extracted by WidgetExtractor"""
+        key = ('widgets', tuple(widget_classes), tuple(feature_keys))
+        if key not in self.memo:
+            extractor = WidgetExtractor(widget_classes, feature_keys)
+            self.memo[key] = PageModel.timed_parse('WidgetExtractor', extractor.extract, self.dom)
+        return [d.copy() for d in self.memo[key]]
+
+    def query(self, key, compute):
+        """compute() once for this page (not memoized if it raises)"""
+        if key not in self.memo:
+            self.memo[key] = compute()
+        return self.memo[key]
+
+    @classmethod
+    def stats(cls):
+        parses = ', '.join(f'{parser} {n} ({cls.parse_times[parser]:.2f} sec)'
+                           for parser, n in cls.parse_counts.items())
+        return f'{cls.num_hits} hits, {cls.num_misses} misses; parses: {parses if parses else "none"}'
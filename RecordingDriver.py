@@ -0,0 +1,225 @@
+import sys
+import gzip
+import json
+import time
+import atexit
+import hashlib
+import zlib
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+from appium.webdriver.mobilecommand import MobileCommand
+
+
+class RecordingElement:
+    """An element found by a RecordingDriver, recording the commands on it with its locator"""
+
+    def __init__(self, recorder, element, locator):
+        self.recorder = recorder
+        self.element = element
+        self.locator = locator  # [by, value, index in the found elements]
+
+    @property
+    def id(self):
+        return self.element.id
+
+    @property
+    def rect(self):
+        return self.recorder.call('rect', lambda: self.element.rect, element=self.locator)
+
+    def is_displayed(self):
+        return self.recorder.call('is_displayed', self.element.is_displayed, element=self.locator)
+
+    def click(self):
+        return self.recorder.call('click', self.element.click, element=self.locator)
+
+    def clear(self):
+        return self.recorder.call('clear', self.element.clear, element=self.locator)
+
+    def send_keys(self, *value):
+        return self.recorder.call('send_keys', lambda: self.element.send_keys(*value), value, self.locator)
+
+    def __getattr__(self, name):  # not recorded
+        return getattr(self.element, name)
+
+
+class RecordingDriver:
+    """A driver recording the commands Runner sends to another driver (e.g., the Appium driver), with their results
+    and timings, into a trace (see RECORD_TRACE in const.py), to replay a transfer without a device
+    (FakeDriver.from_trace), see where the device time goes (python RecordingDriver.py TRACE) or build regression
+    corpora.
+    A trace is a gzip file of json lines, appended to by each session, and written as the session goes, in gzip
+    members of FLUSH_INTERVAL records, each closed when written (so that a session killed loses at most its last
+    records, and the sessions after it can still be read):
+      {"t": 0, "session": {"pkg": ..., "act": ..., "start": "2023-11-20 10:00:00"}}
+      {"t": 1.52, "page": "<sha1>", "dom": "<?xml ..."}  (the first time the page is seen in the session)
+      {"t": 1.52, "cmd": "page_source", "dur": 0.31, "result": "<sha1>"}
+      {"t": 2.1, "cmd": "click", "dur": 0.2, "element": ["id", "com.example:id/ok", 0]}
+      {"t": 3.0, "cmd": "find_elements", "dur": 0.1, "args": ["xpath", "//..."], "error": "NoSuchElementException"}
+    t is the time in sec since the start of the session, and an element is given by how it was found
+    (by, value, index).
+    """
+    FLUSH_INTERVAL = 100  # records buffered before they are written
+    MAX_ELEMENTS = 1000  # element ids remembered for the touch actions
+
+    def __init__(self, driver, trace_path, pkg, act):
+        self.driver = driver
+        self.trace_path = trace_path
+        self.buffer = []  # json lines not written yet
+        self.start = time.perf_counter()
+        self.num_records = 0
+        self.digests = set()  # of the pages written in this session
+        self.element_locators = OrderedDict()  # element id -> locator
+        self.write({'session': {'pkg': pkg, 'act': act, 'start': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}})
+        atexit.register(self.close)
+
+    def write(self, record):
+        record = {'t': round(time.perf_counter() - self.start, 3), **record}
+        self.buffer.append(json.dumps(record) + '\n')
+        self.num_records += 1
+        if len(self.buffer) >= RecordingDriver.FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        # append the buffered records as a gzip member
+        if self.buffer:
+            with gzip.open(self.trace_path, 'at', encoding='utf-8') as f:
+                f.write(''.join(self.buffer))
+            self.buffer = []
+
+    def call(self, cmd, f, args=None, element=None, result=None):
+        """Record the command cmd while calling f; result: what to record of the result of f (default: itself),
+        nothing if None
+        """
+        record = {'cmd': cmd}
+        if element is not None:
+            record['element'] = element
+        if args is not None:
+            record['args'] = list(args)
+        start = time.perf_counter()
+        try:
+            value = f()
+        except Exception as excep:
+            record['dur'] = round(time.perf_counter() - start, 3)
+            record['error'] = f'{type(excep).__name__}: {excep}'.strip()
+            self.write(record)
+            raise
+        record['dur'] = round(time.perf_counter() - start, 3)
+        recorded = result(value) if result is not None else value
+        if recorded is not None:
+            record['result'] = recorded
+        self.write(record)
+        return value
+
+    def close(self):
+        self.flush()
+
+    def record_page(self, dom):
+        digest = hashlib.sha1(dom.encode('utf-8')).hexdigest()
+        if digest not in self.digests:
+            self.digests.add(digest)
+            self.write({'page': digest, 'dom': dom})
+        return digest
+
+    def wrap(self, element, locator):
+        self.element_locators[element.id] = locator
+        if len(self.element_locators) > RecordingDriver.MAX_ELEMENTS:
+            self.element_locators.popitem(last=False)
+        return RecordingElement(self, element, locator)
+
+    # the driver methods used by Runner
+    @property
+    def page_source(self):
+        return self.call('page_source', lambda: self.driver.page_source, result=self.record_page)
+
+    @property
+    def current_package(self):
+        return self.call('current_package', lambda: self.driver.current_package)
+
+    @property
+    def current_activity(self):
+        return self.call('current_activity', lambda: self.driver.current_activity)
+
+    def find_elements(self, by, value):
+        elements = self.call('find_elements', lambda: self.driver.find_elements(by, value), [by, value], result=len)
+        return [self.wrap(e, [by, value, i]) for i, e in enumerate(elements)]
+
+    def find_element(self, by, value):
+        element = self.call('find_element', lambda: self.driver.find_element(by, value), [by, value],
+                            result=lambda e: 1)
+        return self.wrap(element, [by, value, 0])
+
+    def activate_app(self, app_id):
+        return self.call('activate_app', lambda: self.driver.activate_app(app_id), [app_id], result=lambda v: None)
+
+    def terminate_app(self, app_id):
+        return self.call('terminate_app', lambda: self.driver.terminate_app(app_id), [app_id])
+
+    def clear_app(self, app_id):
+        # FakeDriver.clear_app
+        return self.call('clear_app', lambda: self.driver.clear_app(app_id), [app_id], result=lambda v: None)
+
+    def press_keycode(self, keycode, metastate=None, flags=None):
+        return self.call('press_keycode', lambda: self.driver.press_keycode(keycode, metastate, flags), [keycode],
+                         result=lambda v: None)
+
+    def hide_keyboard(self, key_name=None, key=None, strategy=None):
+        return self.call('hide_keyboard', lambda: self.driver.hide_keyboard(key_name, key, strategy),
+                         result=lambda v: None)
+
+    def tap(self, positions, duration=None):
+        return self.call('tap', lambda: self.driver.tap(positions, duration), [positions], result=lambda v: None)
+
+    def swipe(self, start_x, start_y, end_x, end_y, duration=0):
+        return self.call('swipe', lambda: self.driver.swipe(start_x, start_y, end_x, end_y, duration),
+                         [start_x, start_y, end_x, end_y, duration], result=lambda v: None)
+
+    def execute(self, driver_command, params=None):
+        if driver_command == MobileCommand.TOUCH_ACTION:  # e.g., TouchAction(driver).long_press(ele).perform()
+            for a in params['actions']:
+                if a['action'] == 'longPress' and 'element' in a.get('options', {}):
+                    locator = self.element_locators.get(a['options']['element'])
+                    return self.call('long_press', lambda: self.driver.execute(driver_command, params),
+                                     element=locator, result=lambda v: None)
+        return self.call(driver_command, lambda: self.driver.execute(driver_command, params), result=lambda v: None)
+
+    def __getattr__(self, name):  # e.g., desired_capabilities, is_keyboard_shown; not recorded
+        return getattr(self.driver, name)
+
+    @staticmethod
+    def read_trace(trace_path):
+        """The records of a trace, one at a time"""
+        with gzip.open(trace_path, 'rt', encoding='utf-8') as f:
+            try:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:  # the last line of a member cut short
+                        continue
+            except (EOFError, zlib.error, gzip.BadGzipFile):  # a member cut short by a session killed while writing it
+                return
+
+    @staticmethod
+    def summarize(trace_path):
+        # device time by command
+        counts, times = defaultdict(int), defaultdict(float)
+        num_sessions, num_pages, num_errors = 0, 0, 0
+        for record in RecordingDriver.read_trace(trace_path):
+            if 'session' in record:
+                num_sessions += 1
+            elif 'page' in record:
+                num_pages += 1
+            elif 'cmd' in record:
+                counts[record['cmd']] += 1
+                times[record['cmd']] += record.get('dur', 0)
+                num_errors += 'error' in record
+        total = sum(times.values())
+        print(f'{num_sessions} sessions, {num_pages} distinct pages, {num_errors} errors, '
+              f'{total:.1f} sec in device commands')
+        for cmd in sorted(times, key=times.get, reverse=True):
+            share = times[cmd] / total if total else 0
+            print(f'{cmd}: {counts[cmd]} ({times[cmd]:.1f} sec, {share:.1%})')
+
+
+if __name__ == '__main__':
+    # e.g., python RecordingDriver.py trace/a21-a22-b21.jsonl.gz
+    RecordingDriver.summarize(sys.argv[1])
@@ -4,6 +4,8 @@ import lxml.etree
 from bs4 import BeautifulSoup
 from lxml.etree import tostring
 import csv
+# local import
+from WidgetRecord import WidgetRecord
 
 
 class ResourceParser:
@@ -171,7 +173,7 @@ class ResourceParser:
                             if a not in d:
                                 d[a] = ""
                         # if d['name'] or d['oId']:
-                        widgets.append(d)
+                        widgets.append(WidgetRecord.from_dict(d))
                         # print(d)
         return widgets
 
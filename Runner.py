@@ -9,19 +9,40 @@ from selenium.common.exceptions import NoSuchElementException
 import time
 import re
 import subprocess
+from collections import defaultdict
 # local import
 from Databank import Databank
 from misc import teardown_mail
 from StrUtil import StrUtil
+from Settler import Settler
+from StateRestorer import StateRestorer
+from FakeDriver import FakeDriver
+from RecordingDriver import RecordingDriver
+from const import SETTLE_STRATEGY, STATE_RESTORE_POLICY
 
 
 class Runner:
-    def __init__(self, pkg, act, no_reset=False, appium_port='4723', udid=None):
-        desired_caps = Runner.set_caps(pkg, act, no_reset, udid)
-        capabilities_options = UiAutomator2Options().load_capabilities(desired_caps)
-        self.driver = webdriver.Remote(command_executor='http://localhost:' + appium_port, options=capabilities_options)
+    def __init__(self, pkg, act, no_reset=False, appium_port='4723', udid=None, driver=None, trace_path=None):
+        """driver: instead of a session of the Appium server at appium_port, e.g., a FakeDriver to run offline;
+        trace_path: the trace to record the device interactions into (see RecordingDriver)
+        """
+        if driver is None:
+            desired_caps = Runner.set_caps(pkg, act, no_reset, udid)
+            capabilities_options = UiAutomator2Options().load_capabilities(desired_caps)
+            driver = webdriver.Remote(command_executor='http://localhost:' + appium_port, options=capabilities_options)
+        self.is_fake = isinstance(driver, FakeDriver)
+        if trace_path:
+            driver = RecordingDriver(driver, trace_path, pkg, act)
+        self.driver = driver
         self.databank = Databank()
         self.act_interval = 2
+        # a fake screen is idle as soon as an action returns
+        self.settler = Settler.create('none' if self.is_fake else SETTLE_STRATEGY, self)
+        self.restorer = StateRestorer.create(STATE_RESTORE_POLICY, self)
+        # page source, current package and activity, fetched once after the last mutating command (see invalidate)
+        self.device_state = {}
+        self.num_fetches = defaultdict(int)  # query -> number of times fetched from the device
+        self.num_served = defaultdict(int)  # query -> number of times served from device_state
 
     @staticmethod
     def set_caps(app_name, app_activity, no_reset=False, udid=None):
@@ -39,7 +60,15 @@ class Runner:
             caps['udid'] = udid
         return caps
 
+    def restore(self, action_list, require_wait=False, cgp=None):
+        """Same as perform_actions(action_list, require_wait, reset=True, cgp), but from the current state if the
+        restorer can (e.g., if action_list was just performed)
+        """
+        self.restorer.restore(action_list, require_wait, cgp)
+
     def perform_actions(self, action_list, require_wait=False, reset=True, cgp=None):
+        self.invalidate()
+        self.restorer.begin_actions()
         if reset:
             if self.driver.desired_capabilities['desired']['noReset']:
                 # self.driver.launch_app() is deprecated
@@ -47,8 +76,11 @@ class Runner:
             else:
                 # self.driver.reset() is deprecated
                 self.driver.terminate_app(app_id=self.driver.desired_capabilities['appPackage'])
-                subprocess.run(f"adb shell pm clear {self.driver.desired_capabilities['appPackage']}".split(),
-                                stdout=subprocess.DEVNULL)
+                if self.is_fake:  # no device
+                    self.driver.clear_app(self.driver.desired_capabilities['appPackage'])
+                else:
+                    subprocess.run(f"adb shell pm clear {self.driver.desired_capabilities['appPackage']}".split(),
+                                    stdout=subprocess.DEVNULL)
                 self.driver.activate_app(app_id=self.driver.desired_capabilities['appPackage'])
         #time.sleep(self.act_interval)
 
@@ -79,8 +111,14 @@ class Runner:
         #     ele.click()
         # except:
         #     pass
+        prev_kind = 'reset' if reset else 'default'  # of the wait before the next action (see Settler)
+        # whether each action navigated forward, i.e., to an activity not visited in this call (see StateRestorer)
+        navigations = [False] * len(action_list)
+        visited = set()
         for i, action in enumerate(action_list):
-            time.sleep(self.act_interval)
+            self.invalidate()
+            self.settler.settle(prev_kind, self.act_interval)
+            prev_kind = Runner.get_settle_kind(action)
             # print(f'doing action: {action}')
             # print(driver.page_source)
             # if the action is SYS_EVENT, no need to get the element
@@ -136,7 +174,10 @@ class Runner:
             # action performed on the selected element
             ele = self.get_web_element(action)
             act_from = self.get_current_package() + self.get_current_activity()
-            if ele:
+            visited.add(act_from)
+            if not ele:
+                prev_kind = 'EMPTY_EVENT'
+            else:
                 if action['action'][0] == 'click':
                     # specific corner case for Yelp: click the right part
                     if 'activity_login_create_account_question' in action['resource-id']\
@@ -163,7 +204,7 @@ class Runner:
                     ele.send_keys(value_for_input)
                     if action['action'][0].endswith('hide_keyboard'):
                         ele.click()
-                        time.sleep(self.act_interval/2)
+                        self.settler.settle('hide_keyboard', self.act_interval/2)
                         self.hide_keyboard()
                     elif action['action'][0].endswith('enter'):
                         self.driver.press_keycode(66)  # AndroidKeyCode for 'Enter'
@@ -203,15 +244,41 @@ class Runner:
                     ta.long_press(ele).perform()
                 else:
                     assert False, "Unknown action to be performed"
+                self.invalidate()
                 act_to = self.get_current_package() + self.get_current_activity()
+                navigations[i] = act_to not in visited
                 if action['action'][0] in ['click', 'long_press'] and cgp:
                     cgp.add_edge(act_from, act_to, action)
 
+        self.settle_end(require_wait)
+        self.restorer.end_actions(action_list, reset, navigations)
+
+    def settle_end(self, require_wait):
+        # the wait at the end of perform_actions
+        self.invalidate()
         if require_wait:
-            time.sleep(self.act_interval*2)
+            self.settler.settle('end_require_wait', self.act_interval*2)
         else:
             # time.sleep(self.act_interval/2)
-            time.sleep(self.act_interval)
+            self.settler.settle('end', self.act_interval)
+
+    def press_back(self):
+        self.driver.press_keycode(4)  # AndroidKeyCode for 'Back'
+        self.invalidate()
+        self.settler.settle('KEY_BACK', self.act_interval)
+
+    @staticmethod
+    def get_settle_kind(action):
+        # the kind of wait after the action (see SETTLE_BOUNDS)
+        if action['class'] == 'SYS_EVENT':
+            return {'KEY_BACK': 'KEY_BACK', 'restart_app': 'reset'}.get(action['action'][0], 'default')
+        elif action['class'] == 'EMPTY_EVENT':
+            return 'EMPTY_EVENT'
+        elif action['action'][0].startswith('wait_until'):
+            return 'wait_until'
+        elif 'send_keys' in action['action'][0]:
+            return 'send_keys'
+        return action['action'][0]
 
     def get_web_element(self, action):
         ele = None
@@ -286,23 +353,60 @@ class Runner:
             return True
         except:
             return False
+        finally:
+            self.invalidate()  # the screen changed or not while waiting
+
+    def query(self, name, fetch):
+        # the device state as of the last mutating command
+        if name in self.device_state:
+            self.num_served[name] += 1
+        else:
+            self.num_fetches[name] += 1
+            self.device_state[name] = fetch()
+        return self.device_state[name]
+
+    def invalidate(self):
+        """Forget the device state, after a command that may change it"""
+        self.device_state.clear()
 
     def get_current_activity(self):
-        return self.driver.current_activity
+        return self.query('current_activity', lambda: self.driver.current_activity)
 
     def get_page_source(self):
-        self.hide_keyboard()
+        return self.query('page_source', self.fetch_page_source)
+
+    def fetch_page_source(self):
+        if not self.hide_keyboard() and 'settled_page_source' in self.device_state:
+            self.num_served['settled_page_source'] += 1
+            return self.device_state['settled_page_source']
         return self.driver.page_source
 
+    def set_settled_page_source(self, page_source):
+        """The page source of the last poll of a settle wait (see AdaptiveSettler), the page source of the device
+        state unless the keyboard has to be hidden first
+        """
+        self.device_state['settled_page_source'] = page_source
+
     def get_current_package(self):
-        return self.driver.current_package
+        return self.query('current_package', lambda: self.driver.current_package)
+
+    def query_stats(self):
+        # a page source is 2 round-trips (is_keyboard_shown, then page_source)
+        saved = sum(n * (2 if name == 'page_source' else 1) for name, n in self.num_served.items())
+        queries = ', '.join(f'{name} {self.num_fetches[name]} fetched, {self.num_served[name]} served'
+                            for name in sorted(set(self.num_fetches) | set(self.num_served)))
+        return f'{saved} round-trips saved; {queries if queries else "none"}'
 
     def hide_keyboard(self):
+        # whether the keyboard was shown (and hidden)
         if self.driver.is_keyboard_shown:
             try:
                 self.driver.hide_keyboard()
-            except WebDriverException:
-                pass
+            except WebDriverException:  # e.g., no keyboard to hide
+                return False
+            self.invalidate()
+            return True
+        return False
 
     # def is_waited_element_present(self, event):
     #     wait_time, selector_type, selector = event['action'][1:]
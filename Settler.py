@@ -0,0 +1,97 @@
+import hashlib
+import time
+from collections import defaultdict
+from selenium.common.exceptions import WebDriverException
+# local import
+from const import SETTLE_BOUNDS, SETTLE_POLL_INTERVAL
+
+
+class Settler:
+    """How Runner.perform_actions waits for the UI to settle, chosen by SETTLE_STRATEGY in const.py.
+    A wait is of a kind (e.g., 'click': after a click, 'reset': after (re)launching the app, 'end': at the end of
+    perform_actions), and the time of each wait is recorded by kind.
+    """
+
+    def __init__(self):
+        self.settle_times = defaultdict(list)  # kind -> times waited, in sec
+
+    @staticmethod
+    def create(name, runner):
+        if name == 'fixed':
+            return FixedSettler()
+        elif name == 'none':
+            return NoWaitSettler()
+        elif name == 'adaptive':
+            return AdaptiveSettler(runner, SETTLE_BOUNDS, SETTLE_POLL_INTERVAL)
+        else:
+            assert False, f'Unknown settle strategy: {name}'
+
+    def settle(self, kind, fixed_time):
+        """Wait after an action of the kind; fixed_time: the time to sleep without polling the UI"""
+        start = time.perf_counter()
+        self.wait(kind, fixed_time)
+        self.settle_times[kind].append(time.perf_counter() - start)
+
+    def wait(self, kind, fixed_time):
+        raise NotImplementedError
+
+    def stats(self):
+        total = sum(sum(times) for times in self.settle_times.values())
+        kinds = ', '.join(f'{kind} {len(times)} ({sum(times) / len(times):.2f} sec avg)'
+                          for kind, times in sorted(self.settle_times.items()))
+        return f'{total:.1f} sec; {kinds if kinds else "none"}'
+
+
+class FixedSettler(Settler):
+    # sleep Runner.act_interval (or its multiple), as before the adaptive waits
+    def wait(self, kind, fixed_time):
+        time.sleep(fixed_time)
+
+
+class NoWaitSettler(Settler):
+    # e.g., for a FakeDriver
+    def wait(self, kind, fixed_time):
+        pass
+
+
+class AdaptiveSettler(Settler):
+    """Poll the current activity and page source until they stop changing, i.e., until two consecutive polls
+    agree, but wait at least and at most the bounds of the kind (SETTLE_BOUNDS).
+    The polls go through the runner, which keeps the state of the last one (see Runner.query), so it is not fetched
+    again right after the wait.
+    """
+    def __init__(self, runner, bounds, poll_interval):
+        super().__init__()
+        self.runner = runner
+        self.bounds = bounds
+        self.poll_interval = poll_interval
+        self.num_timeouts = 0  # still changing after the max time
+
+    def get_ui_state(self):
+        # (current activity, digest of the page source) and the page source
+        self.runner.invalidate()
+        try:
+            page_source = self.runner.driver.page_source
+            return (self.runner.get_current_activity(), hashlib.sha1(page_source.encode('utf-8')).digest()), \
+                page_source
+        except WebDriverException:  # e.g., while the app is (re)starting
+            return None, None
+
+    def wait(self, kind, fixed_time):
+        min_time, max_time = self.bounds.get(kind, self.bounds['default'])
+        start = time.perf_counter()
+        prev_state, _ = self.get_ui_state()
+        while True:
+            time.sleep(self.poll_interval)
+            state, page_source = self.get_ui_state()
+            elapsed = time.perf_counter() - start
+            if state is not None and state == prev_state and elapsed >= min_time:
+                self.runner.set_settled_page_source(page_source)
+                return
+            if elapsed >= max_time:
+                self.num_timeouts += 1
+                return
+            prev_state = state
+
+    def stats(self):
+        return super().stats() + f', {self.num_timeouts} timeouts'
@@ -0,0 +1,148 @@
+import requests
+import json
+import time
+import numpy as np
+from collections import OrderedDict
+# local import
+from const import W2V_BACKEND, W2V_MODEL_PATH, W2V_FALLBACK_MODEL_PATH, W2V_SERVICE_HOST, W2V_SERVICE_PORT
+
+
+class SimBackend:
+    """Sentence similarity backend used by StrUtil.w2v_sent_sim, chosen by W2V_BACKEND in const.py.
+    Scores are cached in a bounded LRU, since weighted_sim asks the same questions over and over
+    (e.g., the activity similarity for every widget of the same activity, and across rounds of Explorer.run).
+    """
+    instance = None
+    MISSING = object()  # a cached None means the sentences are not comparable
+
+    def __init__(self, cache_size=200000):
+        self.cache = OrderedDict()  # key() -> sent_sim
+        self.cache_size = cache_size
+        self.num_hits = 0
+        self.num_misses = 0
+
+    @staticmethod
+    def get():
+        if not SimBackend.instance:
+            SimBackend.instance = SimBackend.create(W2V_BACKEND)
+        return SimBackend.instance
+
+    @staticmethod
+    def create(name):
+        if name == 'http':
+            return HttpSimBackend(f'http://{W2V_SERVICE_HOST}:{W2V_SERVICE_PORT}')
+        elif name == 'local':
+            return LocalSimBackend(W2V_MODEL_PATH, W2V_FALLBACK_MODEL_PATH)
+        else:
+            assert False, f'Unknown similarity backend: {name}'
+
+    @staticmethod
+    def key(s_new, s_old):
+        # the greedy sentence similarity only depends on the sets of words and is symmetric,
+        # so e.g. (['add', 'note'], ['new']) and (['new'], ['note', 'add', 'add']) share an entry
+        k_new, k_old = tuple(sorted(set(s_new))), tuple(sorted(set(s_old)))
+        return (k_new, k_old) if k_new <= k_old else (k_old, k_new)
+
+    def sent_sim(self, s_new, s_old):
+        return self.sent_sims([(s_new, s_old)])[0]
+
+    def sent_sims(self, pairs):
+        keys = [SimBackend.key(s_new, s_old) for s_new, s_old in pairs]
+        res = [self.cache_get(k) for k in keys]
+        # the backend is queried with the normalized key, so a score does not depend on the order of the words
+        # (only matters for exact ties in the greedy assignment) nor on whether it was cached
+        to_query = list(dict.fromkeys(k for k, sim in zip(keys, res) if sim is SimBackend.MISSING))
+        if to_query:
+            for k, sim in zip(to_query, self.query([(list(k[0]), list(k[1])) for k in to_query])):
+                self.cache_put(k, sim)
+            res = [self.cache_get(k, count=False) if sim is SimBackend.MISSING else sim for k, sim in zip(keys, res)]
+        return res
+
+    def cache_get(self, k, count=True):
+        if k in self.cache:
+            self.cache.move_to_end(k)
+            if count:
+                self.num_hits += 1
+            return self.cache[k]
+        if count:
+            self.num_misses += 1
+        return SimBackend.MISSING
+
+    def cache_put(self, k, sim):
+        self.cache[k] = sim
+        self.cache.move_to_end(k)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def stats(self):
+        total = self.num_hits + self.num_misses
+        hit_rate = self.num_hits / total if total else 0
+        return f'{self.num_hits} hits, {self.num_misses} misses ({hit_rate:.1%} hit rate), {len(self.cache)} cached'
+
+    def query(self, pairs):
+        """Similarity of a list of (s_new, s_old), each a non-empty list of words; None if not comparable"""
+        raise NotImplementedError
+
+    def sent_vecs(self, sents):
+        """Sentence embeddings (unit vectors or zeros) as a 2D numpy array, see SimEngine.sent_vecs"""
+        raise NotImplementedError
+
+
+class HttpSimBackend(SimBackend):
+    # run w2v_service.py first to activate the w2v service
+    def __init__(self, url='http://127.0.0.1:5000', retries=3, backoff=0.5, timeout=60, cache_size=200000):
+        super().__init__(cache_size)
+        self.url = url
+        self.retries = retries
+        self.backoff = backoff  # in sec, doubled after each failed attempt
+        self.timeout = timeout  # in sec
+        self.num_retries = 0
+        # keep-alive connections instead of a new connection per query
+        self.session = requests.Session()
+        self.session.headers.update({'Content-Type': 'application/json'})
+
+    def post(self, path, data):
+        for attempt in range(self.retries + 1):
+            try:
+                resp = self.session.post(url=self.url + path, data=json.dumps(data), timeout=self.timeout)
+                if resp.status_code < 500:
+                    return resp.json()
+                excep = requests.HTTPError(f'{resp.status_code} from {self.url + path}', response=resp)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                excep = e
+            if attempt == self.retries:
+                raise excep
+            self.num_retries += 1
+            print(f'Similarity query failed ({excep}). Retry in {self.backoff * 2 ** attempt} sec')
+            time.sleep(self.backoff * 2 ** attempt)
+
+    def query(self, pairs):
+        if len(pairs) == 1:
+            s_new, s_old = pairs[0]
+            resp = self.post('/w2v', {'s_new': s_new, 's_old': s_old})
+            return [resp['sent_sim'] if 'sent_sim' in resp and resp['sent_sim'] else None]
+        resp = self.post('/w2v_batch', {'pairs': [[s_new, s_old] for s_new, s_old in pairs]})
+        return [sent_sim if sent_sim else None for sent_sim in resp['sent_sims']]
+
+    def sent_vecs(self, sents):
+        if not sents:
+            return np.zeros((0, 0), dtype=np.float32)
+        resp = self.post('/w2v_vec', {'sents': [list(s) for s in sents]})
+        return np.array(resp['vecs'], dtype=np.float32).reshape(len(sents), -1)
+
+    def stats(self):
+        return super().stats() + f', {self.num_retries} retries'
+
+
+class LocalSimBackend(SimBackend):
+    # in-process; with a .kv model, the vectors are memory-mapped and shared with other processes
+    def __init__(self, model_path, fallback_model_path='', cache_size=200000):
+        super().__init__(cache_size)
+        from SimEngine import SimEngine  # gensim is only required by this backend
+        self.engine = SimEngine(SimEngine.load_model(model_path), fallback_model_path=fallback_model_path)
+
+    def query(self, pairs):
+        return [sent_sim if sent_sim else None for sent_sim in self.engine.w2v_sent_sims(pairs)]
+
+    def sent_vecs(self, sents):
+        return self.engine.sent_vecs(sents)
@@ -0,0 +1,153 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import numpy as np
+
+
+class SimCache:
+    """Persistent cache of word-pair similarity scores backed by SQLite.
+    Keys are order-independent since w2v similarity is symmetric. Entries are read lazily on lookup
+    and new scores are buffered in memory and written in batches, so several service processes can
+    share the same cache file (WAL journal) without rewriting the whole cache on every miss.
+    The scores depend on the model (a quantized one gives approximate scores, a vocabulary-restricted one without
+    fallback gives None for the words it lacks), so each model has its own cache file (see get_db_path).
+    """
+    MISSING = object()  # a cached None means the pair is not comparable (OOV word)
+    CHUNK_SIZE = 400  # pairs per query of get_many (2 variables each, under SQLite's default limit of 999)
+
+    def __init__(self, db_path, legacy_pkl_path=None, batch_size=200, flush_interval=10, compact_every=50):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval  # in sec
+        self.compact_every = compact_every  # in number of flushes
+        self.lock = threading.RLock()
+        self.loaded = {}  # entries read from/written to the db by this process
+        self.pending = {}  # entries not yet written to the db
+        self.num_flushes = 0
+        self.last_flush = time.time()
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS sim (w1 TEXT NOT NULL, w2 TEXT NOT NULL, score REAL, '
+                          'PRIMARY KEY (w1, w2)) WITHOUT ROWID')
+        self.conn.commit()
+        if legacy_pkl_path and os.path.exists(legacy_pkl_path):
+            self.import_pkl(legacy_pkl_path)
+
+    @staticmethod
+    def get_db_path(db_path, model_path, fallback_model_path, dtype):
+        """The cache file of a model, e.g., ./w2v_sim_cache-GoogleNews-vectors-negative300-float32.db for
+        ./w2v_sim_cache.db (the .bin model and its .kv conversion have the same vectors, so they share a cache)
+        """
+        def stem(path):
+            return os.path.splitext(os.path.basename(path))[0]
+        root, ext = os.path.splitext(db_path)
+        name = f'{root}-{stem(model_path)}-{np.dtype(dtype).name}'
+        if fallback_model_path:
+            name += f'+{stem(fallback_model_path)}'
+        return name + ext
+
+    @staticmethod
+    def key(w1, w2):
+        return (w1, w2) if w1 <= w2 else (w2, w1)
+
+    def get(self, w1, w2):
+        """Return the cached score (possibly None) or SimCache.MISSING"""
+        k = SimCache.key(w1, w2)
+        with self.lock:
+            if k in self.loaded:
+                return self.loaded[k]
+            row = self.conn.execute('SELECT score FROM sim WHERE w1=? AND w2=?', k).fetchone()
+            if row is None:
+                return SimCache.MISSING
+            self.loaded[k] = row[0]
+            return row[0]
+
+    def get_many(self, pairs):
+        """{key(w1, w2): cached score (possibly None)} of the cached pairs among pairs, read in chunks of
+        CHUNK_SIZE pairs per query
+        """
+        res = {}
+        with self.lock:
+            to_read = []
+            for k in dict.fromkeys(SimCache.key(w1, w2) for w1, w2 in pairs):
+                if k in self.loaded:
+                    res[k] = self.loaded[k]
+                else:
+                    to_read.append(k)
+            for i in range(0, len(to_read), SimCache.CHUNK_SIZE):
+                chunk = to_read[i:i + SimCache.CHUNK_SIZE]
+                # a join, so that each pair is a search by the primary key (IN with row values scans the table)
+                rows = self.conn.execute('WITH q(w1, w2) AS (VALUES ' + ', '.join(['(?, ?)'] * len(chunk)) + ') '
+                                         'SELECT sim.w1, sim.w2, sim.score FROM q CROSS JOIN sim '
+                                         'ON sim.w1 = q.w1 AND sim.w2 = q.w2', [w for k in chunk for w in k])
+                for w1, w2, score in rows:
+                    self.loaded[(w1, w2)] = score
+                    res[(w1, w2)] = score
+        return res
+
+    def put_many(self, scores):
+        """scores: {(w1, w2): score}, buffered as put, but flushed (if due) once for all"""
+        with self.lock:
+            for (w1, w2), score in scores.items():
+                k = SimCache.key(w1, w2)
+                score = None if score is None else float(score)
+                self.loaded[k] = score
+                self.pending[k] = score
+            if len(self.pending) >= self.batch_size or time.time() - self.last_flush > self.flush_interval:
+                self.flush()
+
+    def put(self, w1, w2, score):
+        k = SimCache.key(w1, w2)
+        score = None if score is None else float(score)
+        with self.lock:
+            self.loaded[k] = score
+            self.pending[k] = score
+            if len(self.pending) >= self.batch_size or time.time() - self.last_flush > self.flush_interval:
+                self.flush()
+
+    def flush(self):
+        with self.lock:
+            if self.pending:
+                rows = [(k[0], k[1], v) for k, v in self.pending.items()]
+                # other processes may have written the same pairs in the meantime
+                with self.conn:
+                    self.conn.executemany('INSERT OR IGNORE INTO sim (w1, w2, score) VALUES (?, ?, ?)', rows)
+                self.pending = {}
+                self.num_flushes += 1
+                if self.num_flushes % self.compact_every == 0:
+                    self.compact()
+            self.last_flush = time.time()
+
+    def compact(self):
+        # move the write-ahead log back into the main db file and truncate it
+        with self.lock:
+            self.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def import_pkl(self, pkl_path):
+        """One-time migration of the legacy pickled dict {(w_from, w_to): sim}"""
+        with self.lock:
+            if self.conn.execute('SELECT 1 FROM sim LIMIT 1').fetchone():
+                return
+            with open(pkl_path, 'rb') as f:
+                cached_sim = pickle.load(f)
+            rows = {}
+            for (w1, w2), score in cached_sim.items():
+                rows[SimCache.key(w1, w2)] = None if score is None else float(score)
+            with self.conn:
+                self.conn.executemany('INSERT OR IGNORE INTO sim (w1, w2, score) VALUES (?, ?, ?)',
+                                      [(k[0], k[1], v) for k, v in rows.items()])
+            print(f'Imported {len(rows)} cached similarity scores from {pkl_path}')
+
+    def __len__(self):
+        with self.lock:
+            self.flush()
+            return self.conn.execute('SELECT COUNT(*) FROM sim').fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            self.compact()
+            self.conn.close()
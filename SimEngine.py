@@ -0,0 +1,258 @@
+import sys
+import threading
+import numpy as np
+import gensim
+# local import
+from SimCache import SimCache
+
+
+class SimEngine:
+    """Word/sentence similarity over word2vec vectors.
+    Shared by w2v_service (HTTP backend) and LocalSimBackend (in-process backend), so both give identical scores.
+    """
+
+    def __init__(self, model, cache=None, fallback_model_path=''):
+        self.model = model  # gensim KeyedVectors
+        self.cache = cache  # SimCache (optional)
+        # the full model for words missing from a vocabulary-restricted model (see Vocabulary.py); loaded on demand
+        self.fallback_model_path = fallback_model_path
+        self.fallback_model = None
+        self.oov = set()  # words in neither model
+        self.lock = threading.Lock()  # the service handles requests in threads
+
+    @staticmethod
+    def load_model(model_path):
+        # e.g., './GoogleNews-vectors-negative300.bin' (word2vec binary, fully loaded in memory) or
+        #       './GoogleNews-vectors-negative300.kv' (gensim native format; vectors are memory-mapped read-only,
+        #       so the pages are shared by all processes on the same host through the OS page cache)
+        if model_path.endswith('.bin'):
+            return gensim.models.KeyedVectors.load_word2vec_format(model_path, binary=True)
+        else:
+            return gensim.models.KeyedVectors.load(model_path, mmap='r')
+
+    @staticmethod
+    def convert(bin_path, kv_path):
+        """Convert the word2vec binary to the gensim native format (kv_path and kv_path.vectors.npy)"""
+        model = gensim.models.KeyedVectors.load_word2vec_format(bin_path, binary=True)
+        model.save(kv_path)
+
+    @staticmethod
+    def quantize(model_path, quantized_model_path, dtype):
+        """Store the vectors as float16, or as int8 with a per-vector scale (vector ~= int8 vector * scale)"""
+        model = SimEngine.load_model(model_path)
+        vectors = np.asarray(model.vectors, dtype=np.float32)
+        if dtype == 'float16':
+            quantized = gensim.models.KeyedVectors(model.vector_size, dtype=np.float16)
+            quantized.add_vectors(model.index_to_key, vectors.astype(np.float16))
+        elif dtype == 'int8':
+            scale = np.abs(vectors).max(axis=1) / 127
+            scale[scale == 0] = 1
+            quantized = gensim.models.KeyedVectors(model.vector_size, dtype=np.int8)
+            quantized.add_vectors(model.index_to_key, np.rint(vectors / scale[:, None]).astype(np.int8))
+            quantized.allocate_vecattrs(['scale'], [np.float32])
+            quantized.expandos['scale'][:] = scale
+        else:
+            assert False, f'Unknown dtype for quantization: {dtype}'
+        quantized.save(quantized_model_path)
+
+    @staticmethod
+    def get_row(model, idx):
+        """The float32 vector at idx, dequantized if the model is quantized"""
+        v = model.vectors[idx]
+        if v.dtype == np.int8:
+            return v.astype(np.float32) * model.expandos['scale'][idx]
+        return v.astype(np.float32, copy=False)
+
+    def get_vector(self, w):
+        """Return the vector of w, or None if w is OOV"""
+        if w in self.model.key_to_index:
+            return SimEngine.get_row(self.model, self.model.key_to_index[w])
+        if not self.fallback_model_path or w in self.oov:
+            return None
+        with self.lock:
+            if self.fallback_model is None:
+                print(f'Loading fallback model {self.fallback_model_path} for OOV word: {w}')
+                self.fallback_model = SimEngine.load_model(self.fallback_model_path)
+        if w in self.fallback_model.key_to_index:
+            return SimEngine.get_row(self.fallback_model, self.fallback_model.key_to_index[w])
+        self.oov.add(w)
+        return None
+
+    def w2v_sim(self, w_from, w_to):
+        if self.cache is not None:
+            sim = self.cache.get(w_from, w_to)
+            if sim is not SimCache.MISSING:
+                return sim
+        if w_from.lower() == w_to.lower():
+            sim = 1.0
+        else:
+            v_from, v_to = self.get_vector(w_from), self.get_vector(w_to)
+            if v_from is not None and v_to is not None:
+                # same as KeyedVectors.similarity
+                sim = float(np.dot(gensim.matutils.unitvec(v_from), gensim.matutils.unitvec(v_to)))
+            else:
+                sim = None
+        if self.cache is not None:
+            self.cache.put(w_from, w_to, sim)
+        return sim
+
+    def w2v_sent_sim(self, s_new, s_old):
+        return self.w2v_sent_sims([(s_new, s_old)])[0]
+
+    def w2v_sent_sims(self, pairs):
+        """Vectorized w2v_sent_greedy_sim for a list of (s_new, s_old).
+        The vectors of all the words in the batch are looked up and normalized once, and one matmul gives
+        the cosine matrix that each pair's greedy one-to-one assignment is done on.
+        With a cache, the word pairs of the batch are read from it at once, and only the ones it misses are computed
+        (and then added to it).
+        """
+        words = list(dict.fromkeys(w for s_new, s_old in pairs for s in (s_new, s_old) for w in s))
+        if not words:
+            return [None] * len(pairs)
+        row = {w: i for i, w in enumerate(words)}
+        pair_ids = [([row[w] for w in dict.fromkeys(s_new)], [row[w] for w in dict.fromkeys(s_old)])
+                    for s_new, s_old in pairs]
+        if self.cache is not None:
+            sim = np.full((len(words), len(words)), np.nan, dtype=np.float32)
+            cells = {(i, j) for new_ids, old_ids in pair_ids for i in new_ids for j in old_ids}
+            cached = self.cache.get_many((words[i], words[j]) for i, j in cells)
+            missed = []  # (row, column) not in the cache
+            for i, j in cells:
+                score = cached.get(SimCache.key(words[i], words[j]), SimCache.MISSING)
+                if score is SimCache.MISSING:
+                    missed.append((i, j))
+                elif score is not None:
+                    sim[i, j] = score
+            if missed:
+                ids = sorted({i for cell in missed for i in cell})
+                computed = self.cosine_matrix([words[i] for i in ids])
+                pos = {i: k for k, i in enumerate(ids)}
+                scores = {}
+                for i, j in missed:
+                    sim[i, j] = score = computed[pos[i], pos[j]]
+                    scores[(words[i], words[j])] = None if np.isnan(score) else float(score)
+                self.cache.put_many(scores)
+        else:
+            sim = self.cosine_matrix(words)
+        return [SimEngine.greedy_match(sim[np.ix_(new_ids, old_ids)]) if new_ids and old_ids else None
+                for new_ids, old_ids in pair_ids]
+
+    def cosine_matrix(self, words):
+        """The word similarity matrix of w2v_sim (float32, nan: not comparable)"""
+        in_vocab = np.zeros(len(words), dtype=bool)
+        vecs = np.zeros((len(words), self.model.vector_size), dtype=np.float32)
+        for i, w in enumerate(words):
+            v = self.get_vector(w)
+            if v is not None:
+                in_vocab[i] = True
+                vecs[i] = v
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        vecs = np.divide(vecs, norms, out=np.zeros_like(vecs), where=norms > 0)
+        # float32 products are exact in float64, so rounding the dot back to float32 gives the same score
+        # whatever the size of the batch (i.e., regardless of how BLAS splits up the matmul)
+        vecs = vecs.astype(np.float64)
+        sim = (vecs @ vecs.T).astype(np.float32)
+        # same word regardless of case: 1.0, even if it is OOV; otherwise OOV: not comparable
+        lowered = {}
+        lower_ids = np.array([lowered.setdefault(w.lower(), len(lowered)) for w in words])
+        sim[~(in_vocab[:, None] & in_vocab[None, :])] = np.nan
+        sim[lower_ids[:, None] == lower_ids[None, :]] = 1.0
+        return sim
+
+    def sent_vecs(self, sents):
+        """Sentence embeddings: the normalized mean of the normalized vectors of the words (zeros if all OOV)"""
+        res = np.zeros((len(sents), self.model.vector_size), dtype=np.float32)
+        for i, s in enumerate(sents):
+            for w in dict.fromkeys(s):
+                v = self.get_vector(w)
+                if v is not None:
+                    res[i] += gensim.matutils.unitvec(v)
+        norms = np.linalg.norm(res, axis=1, keepdims=True)
+        return np.divide(res, norms, out=np.zeros_like(res), where=norms > 0)
+
+    @staticmethod
+    def greedy_match(scores):
+        """The greedy one-to-one word assignment of w2v_sent_greedy_sim over a score matrix (nan: not comparable).
+        Ties are broken by the word order in the sentences.
+        """
+        valid = ~np.isnan(scores) & (scores != 0)
+        rows, cols = np.nonzero(valid)
+        if not len(rows):
+            return None
+        values = scores[rows, cols]
+        order = np.lexsort((cols, rows, -values))  # by score (descending), then row, then column
+        used_rows, used_cols = set(), set()
+        counted = []
+        for k in order:
+            r, c = rows[k], cols[k]
+            if r not in used_rows and c not in used_cols:
+                used_rows.add(r)
+                used_cols.add(c)
+                counted.append(float(values[k]))
+        return sum(counted) / len(counted)
+
+    def w2v_sent_greedy_sim(self, s_new, s_old):
+        # calculate the similarity score matrix
+        scores = []
+        valid_new_words = set()
+        valid_old_words = set(s_old)
+        for w1 in s_new:
+            for w2 in valid_old_words:
+                sim = self.w2v_sim(w1, w2)
+                if sim:
+                    valid_new_words.add(w1)
+                    scores.append((w1, w2, sim))
+        scores = sorted(scores, key=lambda x: x[2], reverse=True)
+        counted = []
+        for new_word, old_word, score in scores:
+            if new_word in valid_new_words and old_word in valid_old_words:
+                valid_new_words.remove(new_word)
+                valid_old_words.remove(old_word)
+                counted.append(score)
+            if not valid_new_words or not valid_old_words:
+                break
+        return sum(counted) / len(counted) if counted else None
+
+    def check(self, pairs):
+        """Compare the vectorized and the pairwise greedy sentence similarity"""
+        vectorized = self.w2v_sent_sims(pairs)
+        max_diff, num_mismatch = 0, 0
+        for (s_new, s_old), v in zip(pairs, vectorized):
+            g = self.w2v_sent_greedy_sim(s_new, s_old)
+            if (g is None) != (v is None):
+                num_mismatch += 1
+            elif g is not None:
+                max_diff = max(max_diff, abs(g - v))
+        print(f'{len(pairs)} sentence pairs. Max score difference: {max_diff}. None mismatches: {num_mismatch}')
+
+
+if __name__ == '__main__':
+    # python SimEngine.py convert GoogleNews-vectors-negative300.bin GoogleNews-vectors-negative300.kv
+    # python SimEngine.py check GoogleNews-vectors-negative300.kv
+    # python SimEngine.py quantize GoogleNews-vectors-negative300.kv GoogleNews-vectors-negative300-int8.kv int8
+    #   (see Benchmark.py quantization for the score deviation on the test_repo workload)
+    if len(sys.argv) == 4 and sys.argv[1] == 'convert':
+        SimEngine.convert(sys.argv[2], sys.argv[3])
+    elif len(sys.argv) == 5 and sys.argv[1] == 'quantize':
+        SimEngine.quantize(sys.argv[2], sys.argv[3], sys.argv[4])
+    elif len(sys.argv) == 3 and sys.argv[1] == 'check':
+        import glob
+        import json
+        import os
+        from StrUtil import StrUtil
+        from const import TEST_REPO
+        sents = set()
+        for fpath in glob.glob(os.path.join(TEST_REPO, '*', '*', 'base', '*.json')):
+            with open(fpath, 'r', encoding='utf-8') as f:
+                for e in json.load(f):
+                    for attr in ['resource-id', 'text', 'content-desc', 'parent_text', 'sibling_text']:
+                        if attr in e and e[attr]:
+                            sents.add(tuple(StrUtil.tokenize(attr, e[attr])))
+                    if 'activity' in e and e['activity']:
+                        sents.add(tuple(StrUtil.tokenize('Activity', e['activity'])))
+        sents = sorted(s for s in sents if s)
+        SimEngine(SimEngine.load_model(sys.argv[2])).check([(s1, s2) for s1 in sents for s2 in sents])
+    else:
+        print('Usage: python SimEngine.py convert BIN_PATH KV_PATH\n'
+              '       python SimEngine.py check MODEL_PATH\n'
+              '       python SimEngine.py quantize MODEL_PATH QUANTIZED_MODEL_PATH float16|int8')
@@ -0,0 +1,104 @@
+import sys
+from collections import OrderedDict
+
+
+class StateCache:
+    """WidgetUtil.state_to_widgets: for a gui state (by gui signature), "all_widgets": the widgets found by
+    find_all_widgets, and "most_similar_widgets": a dict for a source widget and the list of its most similar widgets
+    and scores. Bounded by a number of entries and an (estimated) number of bytes, least recently used first out.
+    The signature only depends on the layout, so the widgets are served for the same page content only
+    (e.g., the same screen with another text is extracted again).
+    """
+
+    def __init__(self, max_entries=500, max_bytes=100 * 2 ** 20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # gui signature -> [state, content hash of the page source, size]
+        self.num_bytes = 0
+        self.num_hits = 0
+        self.num_misses = 0
+        self.num_stale = 0  # same signature, different content
+        self.num_evictions = 0
+
+    @staticmethod
+    def sizeof(state):
+        widgets = state.get('all_widgets', [])
+        return sys.getsizeof(widgets) + sum(sys.getsizeof(w) + sum(sys.getsizeof(v) for v in w.values())
+                                            for w in widgets)
+
+    def get_widgets(self, gui_signature, digest=None):
+        """Copies of the widgets of the state, None if not cached;
+        digest: the content hash of the page source the widgets must come from (any page if None)
+        """
+        if gui_signature not in self.entries:
+            self.num_misses += 1
+            return None
+        state, state_digest, _ = self.entries[gui_signature]
+        if digest is not None and digest != state_digest:
+            self.num_stale += 1
+            return None
+        self.entries.move_to_end(gui_signature)
+        self.num_hits += 1
+        return [w.copy() for w in state['all_widgets']]
+
+    def put_widgets(self, gui_signature, widgets, digest=None):
+        self.put(gui_signature, {'all_widgets': [w.copy() for w in widgets], 'most_similar_widgets': {}}, digest)
+
+    def put(self, gui_signature, state, digest=None):
+        self.discard(gui_signature)
+        size = StateCache.sizeof(state)
+        self.entries[gui_signature] = [state, digest, size]
+        self.num_bytes += size
+        while self.entries and (len(self.entries) > self.max_entries or self.num_bytes > self.max_bytes):
+            _, (_, _, evicted_size) = self.entries.popitem(last=False)
+            self.num_bytes -= evicted_size
+            self.num_evictions += 1
+
+    def discard(self, gui_signature):
+        if gui_signature in self.entries:
+            self.num_bytes -= self.entries.pop(gui_signature)[2]
+
+    def __setitem__(self, gui_signature, state):
+        self.put(gui_signature, state)
+
+    def __getitem__(self, gui_signature):
+        return self.entries[gui_signature][0]
+
+    def __delitem__(self, gui_signature):
+        if gui_signature not in self.entries:
+            raise KeyError(gui_signature)
+        self.discard(gui_signature)
+
+    def __contains__(self, gui_signature):
+        return gui_signature in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def keys(self):
+        return self.entries.keys()
+
+    def items(self):
+        return [(sig, entry[0]) for sig, entry in self.entries.items()]
+
+    def update(self, states):
+        for sig, state in dict(states).items():
+            self[sig] = state
+
+    def rekey(self, f):
+        """Rename each signature to f(signature), keeping the order, content hashes and sizes"""
+        self.entries = OrderedDict((f(sig), entry) for sig, entry in self.entries.items())
+        self.num_bytes = sum(entry[2] for entry in self.entries.values())
+
+    def clear(self):
+        self.entries.clear()
+        self.num_bytes = 0
+
+    def stats(self):
+        total = self.num_hits + self.num_misses + self.num_stale
+        hit_rate = self.num_hits / total if total else 0
+        return f'{self.num_hits} hits, {self.num_misses} misses, {self.num_stale} stale ({hit_rate:.1%} hit rate), ' \
+               f'{self.num_evictions} evictions, {len(self.entries)} states ({self.num_bytes / 2 ** 20:.1f} MB)'
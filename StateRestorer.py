@@ -0,0 +1,123 @@
+from collections import OrderedDict, defaultdict
+# local import
+from WidgetUtil import WidgetUtil
+from StrUtil import StrUtil
+from const import STATE_RESTORE_CHECKPOINTS, STATE_RESTORE_MAX_BACK
+
+
+class StateRestorer:
+    """Brings the app to the state after a list of events for Runner.restore (e.g., the tgt events before validating
+    a path in Explorer), chosen by STATE_RESTORE_POLICY in const.py. The events performed since the last reset are
+    tracked by Runner.perform_actions; the outcomes of the restores are counted by way
+    ('reset': reset the app and replay all the events, 'stay', 'back', 'suffix' (replay the rest of the events),
+    'back+suffix', and 'mismatch': a cheaper way failed the verification, then reset).
+    """
+
+    def __init__(self, runner):
+        self.runner = runner
+        self.performed = None  # keys of the events performed since the last reset, None if unknown
+        self.navigations = None  # whether each performed event navigated forward
+        self.pending = None  # performed and navigations before the current perform_actions
+        self.counts = defaultdict(int)  # way -> number of restores
+
+    @staticmethod
+    def create(name, runner):
+        if name == 'reset':
+            return StateRestorer(runner)
+        elif name == 'checkpoint':
+            return CheckpointRestorer(runner, STATE_RESTORE_CHECKPOINTS, STATE_RESTORE_MAX_BACK)
+        else:
+            assert False, f'Unknown state restore policy: {name}'
+
+    @staticmethod
+    def event_key(e):
+        return WidgetUtil.get_identity_key(e, ignore_activity=True), repr(e.get('action'))
+
+    def begin_actions(self):
+        # the state is unknown if perform_actions raises
+        self.pending = (self.performed, self.navigations) if self.performed is not None else None
+        self.performed, self.navigations = None, None
+
+    def end_actions(self, action_list, reset, navigations):
+        """navigations: whether each event of action_list navigated forward (see Runner.perform_actions)"""
+        base = ((), ()) if reset else self.pending
+        if base is not None:
+            self.performed = base[0] + tuple(StateRestorer.event_key(e) for e in action_list)
+            self.navigations = base[1] + tuple(navigations)
+
+    def restore(self, action_list, require_wait=False, cgp=None):
+        self.reset(action_list, require_wait, cgp)
+
+    def reset(self, action_list, require_wait, cgp, way='reset'):
+        self.counts[way] += 1
+        self.runner.perform_actions(action_list, require_wait, reset=True, cgp=cgp)
+
+    def stats(self):
+        total = sum(self.counts.values())
+        ways = ', '.join(f'{way} {n} ({n / total:.1%})' for way, n in sorted(self.counts.items()))
+        return ways if ways else 'none'
+
+
+class CheckpointRestorer(StateRestorer):
+    """Remembers the GUI signature after each perform_actions (a checkpoint of the performed events), and restores
+    from the current state if it is on the way: stay if the events were just performed, press back from (at most
+    max_back) events performed after them or after a prefix of them, and replay the rest of the events from there.
+    Back only undoes events which navigated forward to another activity (e.g., not a text entered or a checkbox
+    clicked, which the layout of the GUI signature would not tell, nor a 'Save' returning to a previous activity),
+    and the app is always reset for an empty prefix (to clear its data).
+    Each way is verified by the GUI signature of the checkpoint, otherwise the app is reset.
+    """
+    def __init__(self, runner, max_checkpoints, max_back):
+        super().__init__(runner)
+        self.checkpoints = OrderedDict()  # keys of the performed events -> gui signature
+        self.max_checkpoints = max_checkpoints
+        self.max_back = max_back
+
+    @staticmethod
+    def enters_email(e):
+        return 'action' in e and 'send_keys' in e['action'][0] and StrUtil.is_contain_email(e['action'][1])
+
+    def get_gui_signature(self):
+        return WidgetUtil.get_gui_signature(self.runner.get_page_source(), self.runner.get_current_package(),
+                                            self.runner.get_current_activity())
+
+    def end_actions(self, action_list, reset, navigations):
+        super().end_actions(action_list, reset, navigations)
+        if self.performed is not None:
+            self.checkpoints[self.performed] = self.get_gui_signature()
+            self.checkpoints.move_to_end(self.performed)
+            if len(self.checkpoints) > self.max_checkpoints:
+                self.checkpoints.popitem(last=False)
+
+    def restore(self, action_list, require_wait=False, cgp=None):
+        keys = tuple(StateRestorer.event_key(e) for e in action_list)
+        performed = self.performed
+        if performed is None:
+            return self.reset(action_list, require_wait, cgp)
+        n_common = 0  # length of the common prefix
+        while n_common < min(len(keys), len(performed)) and keys[n_common] == performed[n_common]:
+            n_common += 1
+        n_back = len(performed) - n_common
+        checkpoint = performed[:n_common]
+        # the GUI signature is the layout, so it cannot tell the app data the events pressed back over changed
+        # (e.g., an item created by a button which also opens it), hence only forward navigations are undone
+        if n_common == 0 or n_back > self.max_back or checkpoint not in self.checkpoints \
+                or not all(self.navigations[n_common:]):
+            return self.reset(action_list, require_wait, cgp)
+        # perform_actions enters the email to confirm after a new one in the same call
+        if any(map(CheckpointRestorer.enters_email, action_list[:n_common])) \
+                and any(map(CheckpointRestorer.enters_email, action_list[n_common:])):
+            return self.reset(action_list, require_wait, cgp)
+        for _ in range(n_back):
+            self.runner.press_back()
+        if self.get_gui_signature() != self.checkpoints[checkpoint]:
+            return self.reset(action_list, require_wait, cgp, 'mismatch')
+        self.checkpoints.move_to_end(checkpoint)
+        self.performed, self.navigations = checkpoint, self.navigations[:n_common]
+        if n_common < len(keys):
+            self.counts['back+suffix' if n_back else 'suffix'] += 1
+            self.runner.perform_actions(action_list[n_common:], require_wait, reset=False, cgp=cgp)
+        else:
+            self.counts['back' if n_back else 'stay'] += 1
+            if require_wait:
+                self.runner.settle_end(require_wait)
@@ -1,7 +1,14 @@
 import re
-import requests
-import json
+from functools import lru_cache
+# local import
+from SimBackend import SimBackend
 
+# compiled once instead of on every call (sanitize and camel_case_split run for every attribute of every widget)
+CAMEL_CASE_RE = re.compile('.+?(?:(?<=[a-z])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])|$)')
+WHITESPACE_RE = re.compile(r'\s')
+NON_WORD_RE = re.compile(r'[^\w ]')
+SPACES_RE = re.compile(r' +')
+EMAIL_RE = re.compile(r'^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$')
 
 class StrUtil:
 
@@ -51,13 +58,13 @@ class StrUtil:
     @staticmethod
     def camel_case_split(identifier):
         # https://stackoverflow.com/questions/29916065/how-to-do-camelcase-split-in-python
-        matches = re.finditer('.+?(?:(?<=[a-z])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])|$)', identifier)
+        matches = CAMEL_CASE_RE.finditer(identifier)
         return [m.group(0) for m in matches]
 
     @staticmethod
     def sanitize(s):
         s = s.strip()
-        s = re.sub(r'\s', ' ', s)  # replace [ \t\n\r\f\v] with space
+        s = WHITESPACE_RE.sub(' ', s)  # replace [ \t\n\r\f\v] with space
         # convert float with 0 fraction to int, e.g., 15.0 -> 15 (a54-a52-b51)
         try:
             if float(s) and float(s) == int(float(s)):
@@ -66,8 +73,8 @@ class StrUtil:
             pass
         for k, v in StrUtil.TEXT_REPLACE.items():
             s = s.replace(k, v)
-        s = re.sub(r'[^\w ]', ' ', s)  # replace non [a-zA-Z0-9_], non-space with space
-        s = re.sub(r' +', ' ', s)
+        s = NON_WORD_RE.sub(' ', s)  # replace non [a-zA-Z0-9_], non-space with space
+        s = SPACES_RE.sub(' ', s)
         return s
 
     @staticmethod
@@ -106,6 +113,17 @@ class StrUtil:
         else:  # never happen
             assert False
 
+    @staticmethod
+    @lru_cache(maxsize=100000)
+    def tokens(s_type, s, use_stopwords=True, w_class=None):
+        """tokenize (and expand_text with w_class if given) as an immutable tuple, memoized since weighted_sim
+        tokenizes the same strings for every (source, candidate) pair. Call tokens.cache_info() for the hit rate.
+        """
+        res = StrUtil.tokenize(s_type, s, use_stopwords=use_stopwords)
+        if w_class is not None:
+            res = StrUtil.expand_text(w_class, s_type, res)
+        return tuple(res)
+
     @staticmethod
     def merge_id(word_list):
         for left, right, merged in StrUtil.MERGE:
@@ -157,15 +175,22 @@ class StrUtil:
 
     @staticmethod
     def w2v_sent_sim(s_new, s_old):
-        # run w2v_service.py first to activate the w2v service
-        data = {'s_new': s_new, 's_old': s_old}
+        # the backend is either w2v_service.py (run it first) or an in-process model, see W2V_BACKEND in const.py
         if len(s_new) == 0 or len(s_old) == 0:
             return None
-        resp = requests.post(url='http://127.0.0.1:5000/w2v', headers={'Content-Type': 'application/json'}, data=json.dumps(data)).json()
-        if 'sent_sim' in resp and resp['sent_sim']:
-            return resp['sent_sim']
-        else:
-            return None
+        return SimBackend.get().sent_sim(s_new, s_old)
+
+    @staticmethod
+    def w2v_sent_sims(pairs):
+        """Batched version of w2v_sent_sim: one query for a list of (s_new, s_old)"""
+        res = [None] * len(pairs)
+        to_query = [i for i, (s_new, s_old) in enumerate(pairs) if len(s_new) > 0 and len(s_old) > 0]
+        if not to_query:
+            return res
+        sent_sims = SimBackend.get().sent_sims([pairs[i] for i in to_query])
+        for i, sent_sim in zip(to_query, sent_sims):
+            res[i] = sent_sim
+        return res
 
     @staticmethod
     def get_tid(fname):
@@ -189,4 +214,4 @@ class StrUtil:
 
     @staticmethod
     def is_contain_email(txt):
-        return re.match(r'^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$', txt)
+        return EMAIL_RE.match(txt)
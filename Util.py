@@ -1,11 +1,12 @@
 import json
 import os
-from copy import deepcopy
 # from numpy import dot
 # from numpy.linalg import norm
 
 from const import TEST_REPO
 from Databank import Databank
+from WidgetFeatures import WidgetFeatures
+from WidgetRecord import WidgetRecord
 import imaplib
 
 
@@ -38,7 +39,7 @@ class Util:
         if not os.path.exists(fdir):
             os.makedirs(fdir)
         fpath = os.path.join(*fpath)
-        new_actions = [deepcopy(a) for a in actions]
+        new_actions = [WidgetFeatures.detach(WidgetRecord.to_dict(a)) for a in actions]
         for a in new_actions:
             if a['class'] in ['EMPTY_EVENT', 'SYS_EVENT']:
                 continue
@@ -53,8 +54,9 @@ class Util:
             json.dump(actions, f, indent=2)
 
     @staticmethod
-    def load_events(config_id, target):
+    def load_events(config_id, target, use_stopwords=None):
         # target: 'generated', 'base_from', 'base_to'
+        # use_stopwords: if given, the events are tokenized for weighted_sim (see WidgetFeatures)
         # e.g., a41a-a42a-b41 -> [Util.TEST_REPO, 'a4', 'b41', 'base', 'a41a.json']
         fpath = [TEST_REPO, config_id[:2], config_id.split('-')[-1]]
         sub_dir = ''
@@ -78,6 +80,9 @@ class Util:
         with open(fpath, 'r', encoding='utf-8') as f:
             acts = json.load(f)
         for act in acts:
+            act = WidgetRecord.from_dict(act)
+            if use_stopwords is not None and act['class'] not in ['EMPTY_EVENT', 'SYS_EVENT']:
+                WidgetFeatures.attach(act, use_stopwords)
             act_list.append(act)
         return act_list
 
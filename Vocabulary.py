@@ -0,0 +1,112 @@
+import os
+import sys
+import glob
+import json
+import numpy as np
+import lxml.etree
+
+# local import
+from StrUtil import StrUtil
+from ResourceParser import ResourceParser
+from const import TEST_REPO, SA_INFO_FOLDER
+
+
+class Vocabulary:
+    """The words CraftDroid may ever compare, i.e., StrUtil.tokenize output over the test cases,
+    the static info of the apps and recorded runtime DOMs, used to build a vocabulary-restricted word2vec model
+    """
+    ATTRS = ['resource-id', 'text', 'content-desc', 'parent_text', 'sibling_text']
+
+    def __init__(self):
+        self.words = set()
+        # expand_text may add these words for resource-id
+        for expand in StrUtil.EXPAND.values():
+            for tokens in expand.values():
+                self.words.update(tokens)
+
+    def add(self, s_type, s):
+        # stopwords are kept, so the vocabulary covers both use_stopwords settings
+        try:
+            self.words.update(StrUtil.tokenize(s_type, s, use_stopwords=False))
+        except AssertionError:  # e.g., resource-id without any word
+            pass
+
+    def add_test_repo(self, test_repo=TEST_REPO):
+        # e.g., test_repo/a2/b21/base/a21.json
+        for fpath in glob.glob(os.path.join(test_repo, '*', '*', 'base', '*.json')):
+            with open(fpath, 'r', encoding='utf-8') as f:
+                events = json.load(f)
+            for e in events:
+                for attr in Vocabulary.ATTRS:
+                    if attr in e and e[attr]:
+                        self.add(attr, e[attr])
+                if 'activity' in e and e['activity']:
+                    self.add('Activity', e['activity'])
+        # e.g., test_repo/a2/a2.config: aid,package,activity
+        for fpath in glob.glob(os.path.join(test_repo, '*', '*.config')):
+            with open(fpath, 'r') as f:
+                for line in f.readlines()[1:]:
+                    if line.strip():
+                        self.add('Activity', line.strip().split(',')[-1])
+
+    def add_sa_info(self, sa_info=SA_INFO_FOLDER):
+        for apk_folder in sorted(glob.glob(os.path.join(sa_info, '*'))):
+            if not os.path.isdir(apk_folder):
+                continue
+            rp = ResourceParser(apk_folder)
+            for text, _ in rp.sName_to_info.values():
+                self.add('text', text)
+            for w in rp.get_widgets():
+                for attr in ['resource-id', 'text', 'content-desc']:
+                    if w[attr]:
+                        self.add(attr, w[attr])
+                if w['activity']:
+                    self.add('Activity', w['activity'])
+            e = lxml.etree.parse(os.path.join(apk_folder, 'AndroidManifest.xml'))
+            for node in e.xpath('//activity'):
+                for k, v in node.attrib.items():
+                    if k.split('}')[-1] == 'name':
+                        self.add('Activity', v)
+
+    def add_doms(self, dom_folder):
+        # recorded page sources (*.xml) from UI Automator
+        for fpath in glob.glob(os.path.join(dom_folder, '**', '*.xml'), recursive=True):
+            try:
+                e = lxml.etree.parse(fpath)
+            except lxml.etree.XMLSyntaxError:
+                continue
+            for node in e.iter():
+                for attr in ['resource-id', 'text', 'content-desc']:
+                    if node.get(attr):
+                        self.add(attr, node.get(attr))
+
+    def build_model(self, model_path, sub_model_path):
+        """Write the vectors of the vocabulary in model_path to a compact model (gensim native format)"""
+        import gensim  # only required for building
+        # local import
+        from SimEngine import SimEngine
+        model = SimEngine.load_model(model_path)
+        keys = sorted(w for w in self.words if w in model.key_to_index)
+        sub_model = gensim.models.KeyedVectors(model.vector_size, dtype=model.vectors.dtype)
+        indices = [model.key_to_index[w] for w in keys]
+        sub_model.add_vectors(keys, model.vectors[indices])
+        if 'scale' in model.expandos:  # an int8 quantized model
+            sub_model.allocate_vecattrs(['scale'], [np.float32])
+            sub_model.expandos['scale'][:] = model.expandos['scale'][indices]
+        sub_model.save(sub_model_path)
+        print(f'{len(self.words)} words in vocabulary, {len(keys)} in the model. Saved to {sub_model_path}')
+
+
+if __name__ == '__main__':
+    # python Vocabulary.py GoogleNews-vectors-negative300.bin w2v_vocab.kv [DOM_FOLDER ...]
+    # then set W2V_MODEL_PATH = './w2v_vocab.kv' in const.py
+    # (and W2V_FALLBACK_MODEL_PATH to the full model for OOV words showing up at runtime)
+    if len(sys.argv) < 3:
+        print('Usage: python Vocabulary.py MODEL_PATH SUB_MODEL_PATH [DOM_FOLDER ...]')
+        sys.exit(1)
+    vocab = Vocabulary()
+    vocab.add_test_repo()
+    vocab.add_sa_info()
+    for folder in sys.argv[3:]:
+        vocab.add_doms(folder)
+    vocab.build_model(sys.argv[1], sys.argv[2])
@@ -0,0 +1,113 @@
+from collections import defaultdict
+# local import
+from WidgetFeatures import WidgetFeatures
+
+
+class WidgetDB:
+    """Explorer.widget_db: the widgets by signature (with the same order as a dict), bucketed by
+    (class, password, clickable) so that most_similar only walks the buckets compatible with the source event,
+    and an inverted index from token to signatures for lexical pre-filtering.
+    An optional WidgetIndex (ANN over embeddings) is kept in sync.
+    """
+    MISSING = 'MISSING'  # static widgets have no 'password' and 'clickable'
+
+    def __init__(self, use_stopwords=True, index=None):
+        self.use_stopwords = use_stopwords
+        self.widgets = {}  # signature -> widget
+        self.entries = {}  # signature -> (insertion sequence number, bucket key, tokens) when inserted
+        self.seq = 0
+        self.buckets = defaultdict(dict)  # bucket key -> {signature: None}
+        self.token_to_sigs = defaultdict(dict)  # token (lowercase) -> {signature: None}
+        self.index = index
+        self.to_index = {}  # signatures added since the last sync of the index
+
+    @staticmethod
+    def get_bucket_key(w):
+        return w['class'], w.get('password', WidgetDB.MISSING), w.get('clickable', WidgetDB.MISSING)
+
+    @staticmethod
+    def get_tokens(w, use_stopwords=True):
+        features = WidgetFeatures.of(w, use_stopwords)
+        return {t.lower() for tokens in features.tokens if tokens for t in tokens}
+
+    def __setitem__(self, sig, w):
+        if sig in self.widgets:
+            seq = self.entries[sig][0]  # same as reassigning a key of a dict
+            self.remove(sig)
+        else:
+            seq = self.seq
+            self.seq += 1
+        WidgetFeatures.attach(w, self.use_stopwords)
+        bucket_key, tokens = WidgetDB.get_bucket_key(w), WidgetDB.get_tokens(w, self.use_stopwords)
+        self.widgets[sig] = w
+        self.entries[sig] = (seq, bucket_key, tokens)
+        self.buckets[bucket_key][sig] = None
+        for token in tokens:
+            self.token_to_sigs[token][sig] = None
+        if self.index is not None:
+            self.to_index[sig] = None
+
+    def remove(self, sig):
+        w = self.widgets.pop(sig)
+        _, bucket_key, tokens = self.entries.pop(sig)
+        del self.buckets[bucket_key][sig]
+        if not self.buckets[bucket_key]:
+            del self.buckets[bucket_key]
+        for token in tokens:
+            del self.token_to_sigs[token][sig]
+            if not self.token_to_sigs[token]:
+                del self.token_to_sigs[token]
+        if self.index is not None:
+            self.to_index.pop(sig, None)
+            self.index.pop(sig)
+        return w
+
+    def pop(self, sig, default=None):
+        return self.remove(sig) if sig in self.widgets else default
+
+    def __getitem__(self, sig):
+        return self.widgets[sig]
+
+    def __contains__(self, sig):
+        return sig in self.widgets
+
+    def __len__(self):
+        return len(self.widgets)
+
+    def __iter__(self):
+        return iter(self.widgets)
+
+    def keys(self):
+        return self.widgets.keys()
+
+    def values(self):
+        return self.widgets.values()
+
+    def items(self):
+        return self.widgets.items()
+
+    def candidates(self, is_candidate, prefer_tokens=None):
+        """The widgets of the buckets for which is_candidate(a widget of the bucket) holds, in insertion order.
+        prefer_tokens: put the widgets sharing any of these tokens first (each part still in insertion order)
+        """
+        sigs = [sig for bucket in self.buckets.values() if is_candidate(self.widgets[next(iter(bucket))])
+                for sig in bucket]
+        sigs.sort(key=lambda sig: self.entries[sig][0])
+        if prefer_tokens:
+            shared = self.sharing_tokens(prefer_tokens)
+            sigs = [sig for sig in sigs if sig in shared] + [sig for sig in sigs if sig not in shared]
+        return [self.widgets[sig] for sig in sigs]
+
+    def sharing_tokens(self, tokens):
+        """Signatures of the widgets with any of the tokens"""
+        res = set()
+        for token in tokens:
+            res.update(self.token_to_sigs.get(token.lower(), {}))
+        return res
+
+    def shortlist(self, src_event, size):
+        """The widgets nearest to src_event by the index, see WidgetIndex.shortlist"""
+        if self.to_index:
+            self.index.update((sig, self.widgets[sig]) for sig in self.to_index)
+            self.to_index = {}
+        return self.index.shortlist(src_event, size)
@@ -0,0 +1,140 @@
+import lxml.etree
+# local import
+from WidgetRecord import WidgetRecord
+
+
+class WidgetExtractor:
+    """Single streaming pass over a page source for WidgetUtil.find_all_widgets, as an lxml parser target.
+    The attributes of the ancestors and of the previous sibling are kept on a stack, so the widget attributes,
+    parent/grandparent text, sibling text and propagated clickability are computed at each start tag, instead of
+    building a BeautifulSoup tree, walking it once per widget class and searching the ancestors of every element.
+    The output is the same as get_widget_from_soup_element over soup.find_all per class of WIDGET_CLASSES
+    (lxml is fed the same way as by BeautifulSoup's 'lxml-xml' parser, so malformed sources are recovered alike).
+    """
+    CHUNK_SIZE = 512  # as BeautifulSoup
+
+    def __init__(self, widget_classes, feature_keys):
+        self.widget_classes = widget_classes
+        self.feature_keys = feature_keys
+        self.stack = []
+        self.class_to_widgets = {}
+        self.reset()
+
+    def reset(self):
+        # [attrs of the element, attrs of its last child element]; the bottom is the document (BeautifulSoup object)
+        self.stack = [[{}, None]]
+        self.class_to_widgets = {w_class: [] for w_class in self.widget_classes}
+
+    @staticmethod
+    def feed(target, dom):
+        """Parse dom with the parser target (which has a reset method) as BeautifulSoup's 'lxml-xml' parser does"""
+        if dom and dom[0] == '\N{BYTE ORDER MARK}':
+            dom = dom[1:]
+        try:
+            return WidgetExtractor.parse(target, dom, None)
+        except (UnicodeDecodeError, LookupError, lxml.etree.ParserError):
+            target.reset()
+            return WidgetExtractor.parse(target, dom.encode('utf-8'), 'utf8')
+
+    @staticmethod
+    def parse(target, dom, encoding):
+        parser = lxml.etree.XMLParser(target=target, strip_cdata=False, recover=True, encoding=encoding)
+        # feed at least once, even if empty, or the parser is not initialized
+        for i in range(0, max(len(dom), 1), WidgetExtractor.CHUNK_SIZE):
+            parser.feed(dom[i:i + WidgetExtractor.CHUNK_SIZE])
+        return parser.close()
+
+    def extract(self, dom):
+        """Widgets in the order of WIDGET_CLASSES, then the document order"""
+        WidgetExtractor.feed(self, dom)
+        widgets = []
+        for w_class in self.widget_classes:
+            for d in self.class_to_widgets[w_class]:
+                if isinstance(d, Exception):  # raised by the first widget in this order, as before
+                    raise d
+                widgets.append(d)
+        return widgets
+
+    def get_widget_from_element(self, e):
+        """get_widget_from_soup_element for an element of a PageTreeBuilder tree"""
+        if e is None or e.get('enabled') != 'true':
+            return None
+        self.stack = [[dict(a.attrib), None] for a in reversed(list(e.iterancestors()))]  # from the document
+        prev_sib = e.getprevious()
+        self.stack[-1][1] = dict(prev_sib.attrib) if prev_sib is not None else None
+        return self.get_widget(dict(e.attrib))
+
+    def ancestor(self, n):
+        # attrs of the n-th ancestor (1: parent), None above the document
+        return self.stack[-n][0] if n <= len(self.stack) else None
+
+    # parser target interface
+    def start(self, tag, attrib, nsmap=None):
+        attrs = dict(attrib)
+        w_class = attrs.get('class')
+        if w_class in self.class_to_widgets and attrs.get('enabled') == 'true':
+            try:
+                d = self.get_widget(attrs)
+            except Exception as excep:
+                d = excep
+            self.class_to_widgets[w_class].append(d)
+        self.stack[-1][1] = attrs
+        self.stack.append([attrs, None])
+
+    def end(self, tag):
+        self.stack.pop()
+
+    def close(self):
+        return None
+
+    def get_widget(self, attrs):
+        # WidgetUtil.get_widget_from_soup_element
+        d = WidgetRecord()
+        for key in self.feature_keys:
+            d[key] = attrs[key] if key in attrs else ''
+            if key == 'class':
+                d[key] = d[key].split()[0]  # for now, only consider the first class
+            elif key == 'clickable' and key in attrs and attrs[key] == 'false':
+                d[key] = self.propagate_clickable()
+            elif key == 'resource-id':
+                rid = d[key].split('/')[-1]
+                prefix = ''.join(d[key].split('/')[:-1])
+                d[key] = rid
+                d['id-prefix'] = prefix + '/' if prefix else ''
+        d['parent_text'] = self.get_parent_text()
+        d['sibling_text'] = self.get_sibling_text()
+        return d
+
+    # WidgetUtil.get_parent_text, get_sibling_text and propagate_clickable of the element above the stack.
+    # BeautifulSoup's 'lxml-xml' parser keeps 'class' as a string, so parent['class'][0] is its first character.
+    def get_parent_text(self):
+        parent_text = ''
+        parent = self.ancestor(1)
+        if 'text' in parent and parent['text']:
+            parent_text += parent['text']
+        parent = self.ancestor(2)
+        if parent is not None and 'text' in parent and parent['text'] and parent['class'][0] == 'TextInputLayout':
+            parent_text += parent['text']
+        return parent_text
+
+    def get_sibling_text(self):
+        sibling_text = ''
+        parent = self.ancestor(1)
+        if parent['class'][0] in ['android.widget.LinearLayout', 'android.widget.RelativeLayout']:
+            prev_sib = self.stack[-1][1]
+            if prev_sib and 'text' in prev_sib and prev_sib['text']:
+                sibling_text = prev_sib['text']
+        return sibling_text
+
+    def propagate_clickable(self):
+        parent = self.ancestor(1)
+        if 'clickable' in parent and parent['clickable'] == 'true':
+            return 'true'
+        for i in range(2):  # a22-a23-b22 (mutated)
+            if self.ancestor(1 + i) is None:
+                raise AttributeError("'NoneType' object has no attribute 'find_parent'")
+            parent = self.ancestor(2 + i)
+            if parent is not None and 'class' in parent and parent['class'][0] in ['android.widget.ListView']:
+                if 'clickable' in parent and parent['clickable'] == 'true':
+                    return 'true'
+        return 'false'
@@ -0,0 +1,94 @@
+# local import
+from StrUtil import StrUtil
+from WidgetRecord import WidgetRecord
+
+
+class WidgetFeatures:
+    """The tokenized textual info of a widget that weighted_sim compares: the tokens of each attribute
+    (after expand_text), which attributes exist and the tokens of the activity.
+    Attached to a widget (w[WidgetFeatures.KEY]) when it enters Explorer.widget_db or a source event is loaded,
+    so that weighted_sim only does the similarity arithmetic.
+    """
+    KEY = 'features'
+    ATTRS = ['resource-id', 'text', 'content-desc', 'parent_text', 'sibling_text']
+    SOURCE_KEYS = ['class', 'activity'] + ATTRS
+    __slots__ = ['use_stopwords', 'source', 'tokens', 'existed', 'act_tokens', 'version']
+
+    def __init__(self, w, use_stopwords=True):
+        self.use_stopwords = use_stopwords
+        self.source = WidgetFeatures.get_source(w)
+        # None: the attribute cannot be tokenized (e.g., resource-id without any word);
+        # tokenize raises when weighted_sim gets to it, as before
+        self.tokens = tuple(WidgetFeatures.try_tokens(attr, w.get(attr), use_stopwords, w.get('class'))
+                            for attr in WidgetFeatures.ATTRS)
+        self.existed = tuple(bool(attr in w and w[attr]) for attr in WidgetFeatures.ATTRS)
+        self.act_tokens = WidgetFeatures.try_tokens('Activity', w.get('activity'), use_stopwords)
+        self.version = None  # of the WidgetRecord it is attached to
+
+    @staticmethod
+    def get_source(w):
+        # the values the features are computed from, to tell if the record is stale (e.g., the widget was modified)
+        return tuple(map(w.get, WidgetFeatures.SOURCE_KEYS))
+
+    @staticmethod
+    def try_tokens(s_type, s, use_stopwords, w_class=None):
+        try:
+            return StrUtil.tokens(s_type, s, use_stopwords, w_class)
+        except AssertionError:
+            return None
+
+    @staticmethod
+    def attach(w, use_stopwords=True):
+        features = WidgetFeatures(w, use_stopwords)
+        w[WidgetFeatures.KEY] = features
+        if isinstance(w, WidgetRecord):
+            features.version = w.version
+        return w
+
+    @staticmethod
+    def detach(w):
+        w.pop(WidgetFeatures.KEY, None)
+        return w
+
+    @staticmethod
+    def of(w, use_stopwords=True):
+        """The attached record if it is up to date, otherwise a new one (not attached)"""
+        features = w.get(WidgetFeatures.KEY)
+        if isinstance(features, WidgetFeatures) and features.use_stopwords == use_stopwords \
+                and (features.version == getattr(w, 'version', False)  # a WidgetRecord not modified since
+                     or features.source == WidgetFeatures.get_source(w)):
+            return features
+        return WidgetFeatures(w, use_stopwords)
+
+    def get_tokens(self, i):
+        # tokens of ATTRS[i]
+        if self.tokens[i] is None:
+            StrUtil.tokenize(WidgetFeatures.ATTRS[i], self.source[2 + i], self.use_stopwords)  # raises
+        return self.tokens[i]
+
+    def get_act_tokens(self):
+        if self.act_tokens is None:
+            StrUtil.tokenize('Activity', self.source[1], self.use_stopwords)  # raises
+        return self.act_tokens
+
+    def __eq__(self, other):
+        return isinstance(other, WidgetFeatures) and self.use_stopwords == other.use_stopwords \
+               and self.source == other.source
+
+    def __hash__(self):
+        return hash((self.use_stopwords, self.source))
+
+    def __deepcopy__(self, memo):
+        return self  # immutable
+
+    def __getstate__(self):
+        return {k: getattr(self, k) for k in WidgetFeatures.__slots__}
+
+    def __setstate__(self, state):
+        for k, v in state.items():
+            setattr(self, k, v)
+        self.version = None  # the versions of the unpickled records are new
+
+    def __repr__(self):
+        # widgets are printed a lot; the tokens are derived from the attributes printed next to it anyway
+        return 'WidgetFeatures(...)'
@@ -0,0 +1,111 @@
+import numpy as np
+# local import
+from SimBackend import SimBackend
+from WidgetFeatures import WidgetFeatures
+
+
+class WidgetIndex:
+    """Approximate nearest-neighbour index (IVF) over the embeddings of the widgets in Explorer.widget_db,
+    to shortlist the candidates most_similar scores exactly on apps with thousands of widgets.
+    A widget's embedding is the sentence embedding of all its attribute tokens (see SimEngine.sent_vecs).
+    The widgets are partitioned by the nearest of sqrt(n) k-means centroids; a query ranks the widgets of
+    the num_probes nearest partitions (and more partitions until the shortlist is full).
+    """
+
+    def __init__(self, use_stopwords=True, num_probes=4, min_train_size=256):
+        self.use_stopwords = use_stopwords
+        self.num_probes = num_probes
+        self.min_train_size = min_train_size  # exhaustive below this size
+        self.entries = {}  # key -> (seq, widget); seq keeps the insertion order of widget_db
+        self.vecs = {}  # key -> unit embedding, or None if the widget has no known word
+        self.seq = 0
+        self.centroids = None  # (num_lists, dim)
+        self.lists = []  # keys in each partition (dicts as ordered sets)
+        self.key_to_list = {}
+        self.num_trained = 0  # size of the index when the centroids were trained
+
+    @staticmethod
+    def get_sent(w, use_stopwords=True):
+        features = WidgetFeatures.of(w, use_stopwords)
+        return [t for tokens in features.tokens if tokens for t in tokens]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def update(self, items):
+        """Add or replace (key, widget), e.g., the items of widget_db"""
+        items = list(items)
+        if not items:
+            return
+        sents = [WidgetIndex.get_sent(w, self.use_stopwords) for _, w in items]
+        vecs = SimBackend.get().sent_vecs(sents)
+        for (key, w), vec in zip(items, vecs):
+            if key in self.entries:
+                seq = self.entries[key][0]  # same as reassigning a key of a dict
+                self.unassign(key)
+            else:
+                seq = self.seq
+                self.seq += 1
+            self.entries[key] = (seq, w)
+            self.vecs[key] = vec if vec.any() else None
+            self.assign(key)
+        if len(self.entries) >= self.min_train_size and len(self.entries) > 2 * self.num_trained:
+            self.train()
+
+    def pop(self, key):
+        if key in self.entries:
+            self.unassign(key)
+            del self.entries[key]
+            del self.vecs[key]
+
+    def assign(self, key):
+        if self.centroids is not None and self.vecs[key] is not None:
+            i = int(np.argmax(self.centroids @ self.vecs[key]))
+            self.lists[i][key] = None
+            self.key_to_list[key] = i
+
+    def unassign(self, key):
+        if key in self.key_to_list:
+            self.lists[self.key_to_list.pop(key)].pop(key, None)
+
+    def train(self, num_iters=10):
+        """k-means (spherical) over the current embeddings; deterministic for the same content"""
+        keys = [k for k, v in self.vecs.items() if v is not None]
+        if not keys:
+            return
+        data = np.stack([self.vecs[k] for k in keys])
+        num_lists = max(1, int(np.sqrt(len(keys))))
+        rng = np.random.default_rng(0)
+        centroids = data[rng.choice(len(keys), num_lists, replace=False)]
+        for _ in range(num_iters):
+            assignment = np.argmax(data @ centroids.T, axis=1)
+            for i in range(num_lists):
+                members = data[assignment == i]
+                if len(members):
+                    c = members.sum(axis=0)
+                    centroids[i] = c / max(np.linalg.norm(c), 1e-12)
+        self.centroids = centroids
+        self.lists = [{} for _ in range(num_lists)]
+        self.key_to_list = {}
+        for k in keys:
+            self.assign(k)
+        self.num_trained = len(self.entries)
+
+    def shortlist(self, src_event, size):
+        """At most size widgets (plus the ones without embedding) nearest to src_event, in widget_db order"""
+        if len(self.entries) <= size or self.centroids is None:
+            return [w for _, w in sorted(self.entries.values(), key=lambda x: x[0])]
+        q = SimBackend.get().sent_vecs([WidgetIndex.get_sent(src_event, self.use_stopwords)])[0]
+        if not q.any():  # nothing to rank by
+            return [w for _, w in sorted(self.entries.values(), key=lambda x: x[0])]
+        candidates = []
+        for n_probed, i in enumerate(np.argsort(-(self.centroids @ q), kind='stable')):
+            if n_probed >= self.num_probes and len(candidates) >= size:
+                break
+            candidates += self.lists[i]
+        if len(candidates) > size:
+            sims = np.stack([self.vecs[k] for k in candidates]) @ q
+            candidates = [candidates[j] for j in np.argsort(-sims, kind='stable')[:size]]
+        # widgets without any known word cannot be ranked, so they are always candidates
+        candidates += [k for k, v in self.vecs.items() if v is None]
+        return [w for _, w in sorted((self.entries[k] for k in candidates), key=lambda x: x[0])]
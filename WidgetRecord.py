@@ -0,0 +1,200 @@
+import sys
+from copy import deepcopy
+from collections.abc import MutableMapping
+
+
+class WidgetRecord(MutableMapping):
+    """A widget or an event with the access of a dict (w['text'], 'text' in w, w.get, w.items(), ...),
+    but stored in __slots__ instead of a per-widget hash table, and with interned string values, so that the
+    thousands of widgets in widget_db, the copies of tgt_events and the pickled snapshots share their strings.
+    Keys other than KEYS (e.g., from a test case of another format) are kept in a dict.
+    Iteration follows KEYS, then the other keys in insertion order.
+    A frozen record (see snapshot) cannot be modified, and its lists are tuples.
+    version changes whenever the record is modified (e.g., for WidgetFeatures.of to skip comparing the attributes).
+    """
+    # the attributes of a widget (WidgetUtil.FEATURE_KEYS and more), of a static one (ResourceParser) and of an event
+    KEYS = ['class', 'resource-id', 'id-prefix', 'text', 'content-desc', 'clickable', 'password', 'naf',
+            'parent_text', 'sibling_text', 'oId', 'layout_name', 'layout_oId', 'method', 'tid', 'package', 'activity',
+            'ignorable', 'event_type', 'score', 'action', 'stepping_events', 'features']
+    SLOTS = ['_' + k.replace('-', '_') for k in KEYS]
+    KEY_TO_SLOT = dict(zip(KEYS, SLOTS))
+    __slots__ = SLOTS + ['_others', '_frozen', 'version']
+    num_versions = 0  # versions are unique across records, so a copy has its own once modified
+
+    def __init__(self, d=(), **kwargs):
+        self._others = None  # created on the first key not in KEYS
+        self._frozen = False
+        self.version = 0
+        self.update(d, **kwargs)
+
+    def touch(self):
+        WidgetRecord.num_versions += 1
+        self.version = WidgetRecord.num_versions
+
+    @staticmethod
+    def from_dict(d):
+        """A record of a dict (e.g., loaded from a json test case), recursively for the stepping events"""
+        w = WidgetRecord()
+        for k, v in d.items():
+            if k == 'stepping_events' and isinstance(v, list):
+                v = [WidgetRecord.from_dict(e) if isinstance(e, dict) else e for e in v]
+            w[k] = v
+        return w
+
+    @staticmethod
+    def to_dict(w):
+        """A plain dict (e.g., to dump as json) with copies of the lists, recursively"""
+        def convert(v):
+            if isinstance(v, (WidgetRecord, dict)):
+                return {k: convert(x) for k, x in v.items()}
+            elif isinstance(v, (list, tuple)):
+                return [convert(x) for x in v]
+            return v
+        return convert(w)
+
+    @staticmethod
+    def freeze(v):
+        # an immutable version of a value (records are frozen, lists become tuples)
+        if isinstance(v, WidgetRecord):
+            return v if v._frozen else v.snapshot()
+        elif isinstance(v, dict):
+            return WidgetRecord.from_dict(v).snapshot()
+        elif isinstance(v, (list, tuple)):
+            return tuple(WidgetRecord.freeze(x) for x in v)
+        return v
+
+    def snapshot(self):
+        """A frozen copy, e.g., to remember an event while the original keeps changing"""
+        if self._frozen:
+            return self
+        w = WidgetRecord()
+        for slot in WidgetRecord.SLOTS:
+            try:
+                setattr(w, slot, WidgetRecord.freeze(getattr(self, slot)))
+            except AttributeError:  # unset
+                pass
+        if self._others:
+            w._others = {k: WidgetRecord.freeze(v) for k, v in self._others.items()}
+        w._frozen = True
+        w.version = self.version
+        return w
+
+    def copy(self):
+        """A modifiable shallow copy (as dict.copy), also of a frozen record"""
+        w = WidgetRecord()
+        for slot in WidgetRecord.SLOTS:
+            try:
+                setattr(w, slot, getattr(self, slot))
+            except AttributeError:
+                pass
+        if self._others:
+            w._others = dict(self._others)
+        w.version = self.version
+        return w
+
+    def __deepcopy__(self, memo):
+        # strings, numbers and WidgetFeatures are immutable, so only the lists are copied
+        if self._frozen:
+            return self
+        w = WidgetRecord()
+        memo[id(self)] = w
+        for slot in WidgetRecord.SLOTS:
+            try:
+                v = getattr(self, slot)
+            except AttributeError:
+                continue
+            setattr(w, slot, WidgetRecord.copy_value(v, memo))
+        if self._others:
+            w._others = {k: WidgetRecord.copy_value(v, memo) for k, v in self._others.items()}
+        w.version = self.version
+        return w
+
+    @staticmethod
+    def copy_value(v, memo):
+        if isinstance(v, list):
+            if id(v) not in memo:
+                memo[id(v)] = [WidgetRecord.copy_value(x, memo) for x in v]
+            return memo[id(v)]
+        elif isinstance(v, WidgetRecord):
+            return v.__deepcopy__(memo) if id(v) not in memo else memo[id(v)]
+        elif isinstance(v, dict):
+            return deepcopy(v, memo)
+        return v
+
+    def __getitem__(self, k):
+        slot = WidgetRecord.KEY_TO_SLOT.get(k)
+        if slot is not None:
+            try:
+                return getattr(self, slot)
+            except AttributeError:
+                raise KeyError(k) from None
+        if self._others is not None and k in self._others:
+            return self._others[k]
+        raise KeyError(k)
+
+    def __setitem__(self, k, v):
+        if self._frozen:
+            raise TypeError('a frozen WidgetRecord cannot be modified')
+        self.touch()
+        if type(v) is str:
+            v = sys.intern(v)
+        slot = WidgetRecord.KEY_TO_SLOT.get(k)
+        if slot is not None:
+            setattr(self, slot, v)
+        else:
+            if self._others is None:
+                self._others = {}
+            self._others[k] = v
+
+    def __delitem__(self, k):
+        if self._frozen:
+            raise TypeError('a frozen WidgetRecord cannot be modified')
+        self.touch()
+        slot = WidgetRecord.KEY_TO_SLOT.get(k)
+        if slot is not None:
+            try:
+                delattr(self, slot)
+            except AttributeError:
+                raise KeyError(k) from None
+        elif self._others is not None and k in self._others:
+            del self._others[k]
+        else:
+            raise KeyError(k)
+
+    def __contains__(self, k):
+        slot = WidgetRecord.KEY_TO_SLOT.get(k)
+        if slot is not None:
+            return hasattr(self, slot)
+        return self._others is not None and k in self._others
+
+    def get(self, k, default=None):
+        slot = WidgetRecord.KEY_TO_SLOT.get(k)
+        if slot is not None:
+            return getattr(self, slot, default)
+        if self._others is not None:
+            return self._others.get(k, default)
+        return default
+
+    def __iter__(self):
+        for k, slot in zip(WidgetRecord.KEYS, WidgetRecord.SLOTS):
+            if hasattr(self, slot):
+                yield k
+        if self._others:
+            yield from self._others
+
+    def __len__(self):
+        return sum(1 for slot in WidgetRecord.SLOTS if hasattr(self, slot)) + (len(self._others) if self._others else 0)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def __getstate__(self):
+        return {k: v for k, v in self.items()}, self._frozen
+
+    def __setstate__(self, state):
+        d, frozen = state
+        self._others = None
+        self._frozen = False
+        self.version = 0
+        self.update(d)
+        self._frozen = frozen
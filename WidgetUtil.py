@@ -1,8 +1,19 @@
-from bs4 import BeautifulSoup
-import xml.etree.ElementTree as ET
 import re
+import math
+import lxml.etree
+from functools import lru_cache
+import heapq
+import hashlib
+from collections import deque
 # local import
 from StrUtil import StrUtil
+from WidgetFeatures import WidgetFeatures
+from WidgetDB import WidgetDB
+from PageModel import PageModel
+from WidgetExtractor import WidgetExtractor
+from WidgetRecord import WidgetRecord
+from StateCache import StateCache
+from const import GUI_SIGNATURE_LEGACY, STATE_CACHE_SIZE, STATE_CACHE_BYTES
 
 
 class WidgetUtil:
@@ -10,31 +21,72 @@ class WidgetUtil:
     FEATURE_KEYS = ['class', 'resource-id', 'text', 'content-desc', 'clickable', 'password', 'naf']
     WIDGET_CLASSES = ['android.widget.EditText', 'android.widget.MultiAutoCompleteTextView', 'android.widget.TextView',
                       'android.widget.Button', 'android.widget.ImageButton', 'android.view.View']
-    state_to_widgets = {}  # for a gui state, there are "all_widgets": a list of all widgets, and
-                           # "most_similar_widgets": a dict for a source widget and the list of its most similar widgets and scores
+    # for a gui state, there are "all_widgets": a list of all widgets, and
+    # "most_similar_widgets": a dict for a source widget and the list of its most similar widgets and scores
+    state_to_widgets = StateCache(STATE_CACHE_SIZE, STATE_CACHE_BYTES)
+    XPATH_NAME_RE = re.compile(r'[A-Za-z_][\w.-]*')  # attribute names usable as is in an XPath (see get_locator)
+    # the attributes compared by is_equal (see get_identity_key)
+    IDENTITY_KEYS = sorted(set(FEATURE_KEYS) - {'naf'})
+    IDENTITY_KEYS_WITH_ACTIVITY = sorted(set(IDENTITY_KEYS) | {'package', 'activity'})
 
     @staticmethod
-    def get_gui_signature(xml_dom, pkg_name, act_name):
+    def get_gui_signature(xml_dom, pkg_name, act_name, legacy=GUI_SIGNATURE_LEGACY):
         """Get the signature for a GUI state by the package/activity name and the xml hierarchy
         Breadth first traversal for the non-leaf/leaf nodes and their cumulative index sequences
+        xml_dom: a page source or a PageModel
+        legacy: pkg!act!layouts!leaves with the index sequences themselves (readable, for debugging),
+        otherwise pkg!act!digest where digest is a fixed-size hash of them
         """
-        xml_dom = re.sub(r'&#\d+;', "", xml_dom)  # remove emoji
-        root = ET.fromstring(xml_dom)
-        queue = [(root, '0')]
+        page = PageModel.of(xml_dom)
+        layouts, executable_leaves = page.query('layout_signature',
+                                                lambda: WidgetUtil.get_layout_signature(page.get_tree()))
+        if legacy:
+            return '!'.join([pkg_name, act_name, layouts, executable_leaves])
+        digest = page.query('layout_digest', lambda: WidgetUtil.get_layout_digest(layouts, executable_leaves))
+        return '!'.join([pkg_name, act_name, digest])
+
+    @staticmethod
+    def get_layout_signature(root):
+        queue = deque([(root, '0')])
         layouts = []
         executable_leaves = []
         while queue:
-            node, idx = queue.pop()
-            if len(list(node)):  # the node has child(ren)
+            node, idx = queue.popleft()
+            if len(node):  # the node has child(ren)
                 layouts.append(idx)
                 for i, child in enumerate(node):
-                    queue.insert(0, (child, idx + '-' + str(i)))
+                    queue.append((child, idx + '-' + str(i)))
             else:  # a leaf node
                 executable_leaves.append(idx)
         # print(layouts)
         # print(executable_leaves)
-        sign = [pkg_name, act_name, '+'.join(layouts), '+'.join(executable_leaves)]
-        return '!'.join(sign)
+        return '+'.join(layouts), '+'.join(executable_leaves)
+
+    @staticmethod
+    def get_layout_digest(layouts, executable_leaves):
+        return hashlib.sha1(f'{layouts}!{executable_leaves}'.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def migrate_gui_signature(gui_signature):
+        """The signature of the same GUI state from a legacy one (pkg!act!layouts!leaves); others are unchanged"""
+        parts = gui_signature.rsplit('!', 2)
+        if len(parts) < 3 or not re.fullmatch(r'[\d+-]*', parts[1] + parts[2]):
+            return gui_signature
+        prefix, layouts, executable_leaves = parts
+        return '!'.join([prefix, WidgetUtil.get_layout_digest(layouts, executable_leaves)])
+
+    @classmethod
+    def migrate_state_to_widgets(cls, state_to_widgets=None):
+        """Re-key a state_to_widgets cache (WidgetUtil.state_to_widgets by default) built with legacy signatures"""
+        if state_to_widgets is None:
+            state_to_widgets = cls.state_to_widgets
+        if isinstance(state_to_widgets, StateCache):
+            state_to_widgets.rekey(cls.migrate_gui_signature)
+            return state_to_widgets
+        migrated = {cls.migrate_gui_signature(sig): v for sig, v in state_to_widgets.items()}
+        state_to_widgets.clear()
+        state_to_widgets.update(migrated)
+        return state_to_widgets
 
     @classmethod
     def get_widget_signature(cls, w):
@@ -61,11 +113,7 @@ class WidgetUtil:
     @classmethod
     def get_all_widgets_from_cache(cls, gui_signature):
         """Return all widgets in a gui state in cache"""
-        if gui_signature in cls.state_to_widgets and 'all_widgets' in cls.state_to_widgets[gui_signature]:
-            # print('Cache HIT from ALL')
-            return cls.state_to_widgets[gui_signature]['all_widgets']
-        else:
-            return None
+        return cls.state_to_widgets.get_widgets(gui_signature)
 
     @staticmethod
     def get_parent_text(soup_ele):
@@ -94,7 +142,7 @@ class WidgetUtil:
 
     @classmethod
     def get_attrs(cls, dom, attr_name, attr_value, tag_name=''):
-        soup = BeautifulSoup(dom, 'lxml-xml')
+        soup = PageModel.of(dom).get_soup()
         if attr_name == 'text-contain':
             cond = {'text': lambda x: x and attr_value in x}
         else:
@@ -126,6 +174,7 @@ class WidgetUtil:
 
     @classmethod
     def find_all_widgets(cls, dom, pkg, act, target_pkg, update_cache=True):
+        # dom: a page source or a PageModel
         if 'com.android.launcher' in pkg:  # the app is closed
             return []
 
@@ -135,33 +184,34 @@ class WidgetUtil:
         if act.startswith('com.facebook'):  # the app reaches facebook login, out of the app's scope
             return []
 
-        gui_signature = WidgetUtil.get_gui_signature(dom, pkg, act)
+        page = PageModel.of(dom)
+        gui_signature = WidgetUtil.get_gui_signature(page, pkg, act)
         if not update_cache:
             widgets = WidgetUtil.get_all_widgets_from_cache(gui_signature)
             if widgets:
                 return widgets
+        else:  # only for the same page content, since the signature does not depend on the texts
+            widgets = cls.state_to_widgets.get_widgets(gui_signature, page.digest)
+            if widgets is not None:
+                return widgets
 
-        soup = BeautifulSoup(dom, 'lxml-xml')
+        # single streaming pass, same widgets as get_widget_from_soup_element over soup.find_all per class
         widgets = []
-        for w_class in cls.WIDGET_CLASSES:
-            elements = soup.find_all(attrs={'class': w_class})
-            for e in elements:
-                d = cls.get_widget_from_soup_element(e)
-                if d:
-                    if 'yelp' in gui_signature and 'text' in d and d['text'] == 'Sign up with Google':
-                        d['text'] = 'SIGN UP WITH GOOGLE'  # Specific for Yelp
-                    d['package'], d['activity'] = pkg, act
-                    widgets.append(d)
+        for d in page.get_widgets(cls.WIDGET_CLASSES, cls.FEATURE_KEYS):
+            if 'yelp' in gui_signature and 'text' in d and d['text'] == 'Sign up with Google':
+                d['text'] = 'SIGN UP WITH GOOGLE'  # Specific for Yelp
+            d['package'], d['activity'] = pkg, act
+            widgets.append(d)
 
         if widgets or update_cache:
-            cls.state_to_widgets[gui_signature] = {'all_widgets': widgets, 'most_similar_widgets': {}}
+            cls.state_to_widgets.put_widgets(gui_signature, widgets, page.digest)
         return widgets
 
     @classmethod
     def get_widget_from_soup_element(cls, e):
         if not e:
             return None
-        d = {}
+        d = WidgetRecord()
         if 'enabled' in e.attrs and e['enabled'] == 'true':
             for key in cls.FEATURE_KEYS:
                 d[key] = e.attrs[key] if key in e.attrs else ''
@@ -307,16 +357,18 @@ class WidgetUtil:
     #         return None
 
     @staticmethod
-    def weighted_sim(new_widget, old_widget, use_stopwords=True, cross_check=False):
+    def weighted_sim(new_widget, old_widget, use_stopwords=True, cross_check=False, sent_sim=None):
         # similarity score is computed by the textual info of the widgets and the activities they belong to
+        # sent_sim: the sentence similarity function; StrUtil.w2v_sent_sim by default (see most_similar for batch)
+        # the tokens come from the widgets' WidgetFeatures (tokenized once when they enter widget_db)
         # cross check NL info in text and content-desc
         # consider sibling text and adjust weights for parent and sibling for tip apps
-        attrs = ['resource-id', 'text', 'content-desc', 'parent_text', 'sibling_text']
+        attrs = WidgetFeatures.ATTRS
+        sent_sim = sent_sim if sent_sim else StrUtil.w2v_sent_sim
+        f_new, f_old = WidgetFeatures.of(new_widget, use_stopwords), WidgetFeatures.of(old_widget, use_stopwords)
 
         # not to evaluate widget without textual info
-        is_attr_existed_old = [a in old_widget and old_widget[a] for a in attrs]
-        is_attr_existed_new = [a in new_widget and new_widget[a] for a in attrs]
-        if not any(is_attr_existed_old) or not any(is_attr_existed_new):
+        if not any(f_old.existed) or not any(f_new.existed):
             return None
 
         attrs_weights = [1, 1, 1, 1, 0.5]  # higher weights for 'main' info source; proportionate to the DOM distance
@@ -324,12 +376,10 @@ class WidgetUtil:
         for i, attr in enumerate(attrs):
             score = 0
             if attr in new_widget and attr in old_widget:
-                s_new = StrUtil.tokenize(attr, new_widget[attr], use_stopwords=use_stopwords)
-                s_new = StrUtil.expand_text(new_widget['class'], attr, s_new)
-                s_old = StrUtil.tokenize(attr, old_widget[attr], use_stopwords=use_stopwords)
-                s_old = StrUtil.expand_text(old_widget['class'], attr, s_old)
+                s_new = f_new.get_tokens(i)
+                s_old = f_old.get_tokens(i)
                 if s_new and s_old:
-                    sim = StrUtil.w2v_sent_sim(s_new, s_old)
+                    sim = sent_sim(s_new, s_old)
                     if sim:
                         # if no text and no parent_text, sibling text is more important
                         # (a22-a23-b21: srcIdx 1; a25-a23-b21: srcIdx 1)
@@ -343,17 +393,15 @@ class WidgetUtil:
             w_scores.append(score)
 
         # cross check parent_text and text
-        text_attrs = ['text', 'parent_text']#, 'sibling_text']
+        text_attrs = [attrs.index('text'), attrs.index('parent_text')]#, attrs.index('sibling_text')]
         cross_score = -1
-        for a1 in text_attrs:
-            for a2 in text_attrs:
-                if a1 != a2 and a1 in new_widget and new_widget[a1] and a2 in old_widget and old_widget[a2]:
-                    s_new = StrUtil.tokenize(a1, new_widget[a1], use_stopwords=use_stopwords)
-                    s_new = StrUtil.expand_text(new_widget['class'], a1, s_new)
-                    s_old = StrUtil.tokenize(a2, old_widget[a2], use_stopwords=use_stopwords)
-                    s_old = StrUtil.expand_text(old_widget['class'], a2, s_old)
+        for i1 in text_attrs:
+            for i2 in text_attrs:
+                if i1 != i2 and f_new.existed[i1] and f_old.existed[i2]:
+                    s_new = f_new.get_tokens(i1)
+                    s_old = f_old.get_tokens(i2)
                     if s_new and s_old:
-                        sim = StrUtil.w2v_sent_sim(s_new, s_old)
+                        sim = sent_sim(s_new, s_old)
                         if sim and sim > cross_score:
                             cross_score = sim
         if cross_score > -1:
@@ -361,24 +409,19 @@ class WidgetUtil:
 
         if not w_scores and cross_check:  # cross check the NL info (Target app registration)
             cross_score = -1
-            for a1 in attrs:
-                for a2 in attrs:
-                    if a1 != a2 and a1 in new_widget and new_widget[a1] and a2 in old_widget and old_widget[a2]:
-                        s_new = StrUtil.tokenize(a1, new_widget[a1], use_stopwords=use_stopwords)
-                        s_new = StrUtil.expand_text(new_widget['class'], a1, s_new)
-                        s_old = StrUtil.tokenize(a2, old_widget[a2], use_stopwords=use_stopwords)
-                        s_old = StrUtil.expand_text(old_widget['class'], a2, s_old)
+            for i1 in range(len(attrs)):
+                for i2 in range(len(attrs)):
+                    if i1 != i2 and f_new.existed[i1] and f_old.existed[i2]:
+                        s_new = f_new.get_tokens(i1)
+                        s_old = f_old.get_tokens(i2)
                         if s_new and s_old:
-                            sim = StrUtil.w2v_sent_sim(s_new, s_old)
+                            sim = sent_sim(s_new, s_old)
                             if sim and sim > cross_score:
                                 cross_score = sim
             if cross_score > -1:
                 w_scores.append(cross_score)
 
-        state_score = StrUtil.w2v_sent_sim(
-            StrUtil.tokenize('Activity', old_widget['activity'], use_stopwords=use_stopwords),
-            StrUtil.tokenize('Activity', new_widget['activity'], use_stopwords=use_stopwords)
-        )
+        state_score = sent_sim(f_old.get_act_tokens(), f_new.get_act_tokens())
         # state_score = state_score if state_score else -1
         # # weight_w, weight_state = 0.5, 0.5
         # weight_w, weight_state = 0.65, 0.35  # a31-a32-b31
@@ -393,26 +436,54 @@ class WidgetUtil:
         w_scores.append(state_score)
         return sum(w_scores) / len(w_scores)
 
+    @staticmethod
+    def batch_weighted_sim(new_widgets, old_widget, use_stopwords=True, cross_check=False):
+        """weighted_sim of each new widget against the same old widget with a single similarity query.
+        The control flow of weighted_sim does not depend on the similarity values, so a first pass collects
+        the sentence pairs it would ask for, and a second pass computes the scores from the fetched values.
+        """
+        pairs = {}
+
+        def collect(s_new, s_old):
+            if s_new and s_old:
+                pairs[(tuple(s_new), tuple(s_old))] = None
+            return None
+
+        for w in new_widgets:
+            WidgetUtil.weighted_sim(w, old_widget, use_stopwords, cross_check, sent_sim=collect)
+        keys = list(pairs.keys())
+        sims = dict(zip(keys, StrUtil.w2v_sent_sims(keys)))
+
+        def lookup(s_new, s_old):
+            return sims.get((tuple(s_new), tuple(s_old)))
+
+        return [WidgetUtil.weighted_sim(w, old_widget, use_stopwords, cross_check, sent_sim=lookup)
+                for w in new_widgets]
+
     @classmethod
     def is_equal(cls, w1, w2, ignore_activity=False):
-        if not w1 or not w2:
-            return False
-        keys_for_equality = set(cls.FEATURE_KEYS)
-        keys_for_equality.remove('naf')
-        if not ignore_activity:
-            keys_for_equality = keys_for_equality.union({'package', 'activity'})
-        for k in keys_for_equality:
-            if (k in w1 and k not in w2) or (k not in w1 and k in w2):
-                return False
-            if k in w1 and k in w2:
-                v1, v2 = w1[k], w2[k]
-                if k == 'resource-id' and 'id-prefix' in w1:
-                    v1 = w1['id-prefix'] + w1[k]
-                if k == 'resource-id' and 'id-prefix' in w2:
-                    v2 = w2['id-prefix'] + w2[k]
-                if v1 != v2:
-                    return False
-        return True
+        key1 = cls.get_identity_key(w1, ignore_activity)
+        return key1 is not None and key1 == cls.get_identity_key(w2, ignore_activity)
+
+    @classmethod
+    def get_identity_key(cls, w, ignore_activity=False):
+        """A hashable key of the widget such that is_equal(w1, w2) iff both keys are equal, e.g., for sets of widgets;
+        None for an empty widget (equal to no widget).
+        The key is the bitmask of the compared attributes present in w, then their values (with id-prefix).
+        """
+        if not w:
+            return None
+        present = 0
+        key = [None]  # for present
+        for i, k in enumerate(cls.IDENTITY_KEYS if ignore_activity else cls.IDENTITY_KEYS_WITH_ACTIVITY):
+            if k in w:
+                present |= 1 << i
+                v = w[k]
+                if k == 'resource-id' and 'id-prefix' in w:
+                    v = w['id-prefix'] + v
+                key.append(v)
+        key[0] = present
+        return tuple(key)
 
     '''
     @staticmethod
@@ -438,22 +509,48 @@ class WidgetUtil:
         # e.g., criteria =
         #   {'class': 'TextView', 'text': 'Okay', 'resource-id': 'tv_task', 'content-desc': ""} or
         #   {'class': 'android.widget.Button', 'resource-id': 'org.secuso.privacyfriendlytodolist:id/btn_skip'}
-        regex_cria = {}
-        for k, v in criteria.items():
-            if v:
-                v = v.replace('+', r'\+')  # for error when match special char '+'
-                v = v.replace('?', r'\?')  # for error when match special char '?'
-                if k == 'resource-id':
-                    regex_cria[k] = re.compile(f'{v}$')
-                else:
-                    regex_cria[k] = re.compile(f'{v}')
-        if not regex_cria:
+        # the first element (in document order) whose attributes contain the values, literally;
+        # resource-id ends with the value (the value can be the id without the package prefix)
+        criteria = {k: v for k, v in criteria.items() if v}
+        if not criteria:
             return None
-        soup = BeautifulSoup(dom, 'lxml-xml')
-        return cls.get_widget_from_soup_element(soup.find(attrs=regex_cria))
+        page = PageModel.of(dom)
+
+        def locate():
+            variables = {}
+            for i, (k, v) in enumerate(criteria.items()):
+                variables[f'k{i}'], variables[f'v{i}'], variables[f'n{i}'] = k, v, v + '\n'
+            found = WidgetUtil.get_locator(tuple(criteria.keys()))(page.get_element_tree(), **variables)
+            e = found[0] if found else None
+            return WidgetExtractor(cls.WIDGET_CLASSES, cls.FEATURE_KEYS).get_widget_from_element(e)
+
+        w = page.query(('locate_widget', tuple(sorted(criteria.items()))), locate)
+        return w.copy() if w else w
+
+    @staticmethod
+    @lru_cache(maxsize=1000)
+    def get_locator(keys):
+        """Compiled XPath for the criteria of locate_widget with these keys (in this order).
+        The criteria are XPath variables, so the values need no escaping: $k0, $v0 and $n0 are the first key,
+        its value and the value followed by a newline, and so on
+        """
+        conds = []
+        for i, k in enumerate(keys):
+            attr = f'@{k}' if WidgetUtil.XPATH_NAME_RE.fullmatch(k) else f'@*[name()=$k{i}]'
+            if k == 'resource-id':  # as re.search(f'{v}$')
+                conds.append(f'substring({attr}, string-length({attr}) - string-length($v{i}) + 1) = $v{i}'
+                             f' or substring({attr}, string-length({attr}) - string-length($n{i}) + 1) = $n{i}')
+            else:  # as re.search(v)
+                conds.append(f'contains({attr}, $v{i})')
+        return lxml.etree.XPath('(.//*[' + ' and '.join(f'({cond})' for cond in conds) + '])[1]')
 
     @classmethod
-    def most_similar(cls, src_event, widgets, use_stopwords=True, expand_btn_to_text=False, cross_check=False):
+    def most_similar(cls, src_event, widgets, use_stopwords=True, expand_btn_to_text=False, cross_check=False,
+                     batch=False, k=None, lexical_first=False):
+        # widgets: a list of widgets or a WidgetDB (only the compatible buckets are walked)
+        # batch: query the similarity service once for all the widgets instead of once per sentence pair
+        # k: only the k most similar widgets (same as the first k of the full result), see top_k_similar
+        # lexical_first: with a WidgetDB, the widgets sharing a token with src_event come first among equal scores
         src_class = src_event['class']
         is_clickable = src_event['clickable']  # string
         is_password = src_event['password']  # string
@@ -503,26 +600,39 @@ class WidgetUtil:
         elif src_class == 'android.widget.MultiAutoCompleteTextView':  # a41-a43-b42
             tgt_classes.append('android.widget.EditText')
 
-        for w in widgets:
-            need_evaluate = False
+        def need_evaluate(w):
+            # only depends on the class, password and clickable of w (see WidgetDB buckets)
             if w['class'] in tgt_classes:
                 if 'password' in w and w['password'] != is_password:
-                    continue
-                if 'clickable' in w:  # a dynamic widget                    
+                    return False
+                if 'clickable' in w:  # a dynamic widget
                     if w['clickable'] == is_clickable:
-                        need_evaluate = True
+                        return True
                     elif 'action' in src_event and 'class' in w:
                         # if checking oracle, no need to check clickable consistence for TextView and EditText
                         # (e.g., a53-a51-b51 and a51-a53-b51)
                         if src_event['action'][0].startswith('wait_until') \
                                 and w['class'] in ['android.widget.EditText', 'android.widget.TextView']:
-                            need_evaluate = True                    
+                            return True
                         elif src_event['action'][0].startswith('swipe') and w['class'] in ['android.widget.TextView']:
                             # a21-a25-b22; no need to check clickable consistence for TextView and swipe action
-                            need_evaluate = True
+                            return True
                 else:  # a static widget
-                    need_evaluate = True
-            score = WidgetUtil.weighted_sim(w, src_event, use_stopwords, cross_check) if need_evaluate else None
+                    return True
+            return False
+
+        if isinstance(widgets, WidgetDB):
+            prefer_tokens = WidgetDB.get_tokens(src_event, use_stopwords) if lexical_first else None
+            to_evaluate = widgets.candidates(need_evaluate, prefer_tokens)
+        else:
+            to_evaluate = [w for w in widgets if need_evaluate(w)]
+        if k is not None:
+            return WidgetUtil.top_k_similar(to_evaluate, src_event, k, use_stopwords, cross_check, batch)
+        if batch:
+            scores = WidgetUtil.batch_weighted_sim(to_evaluate, src_event, use_stopwords, cross_check)
+        else:
+            scores = [WidgetUtil.weighted_sim(w, src_event, use_stopwords, cross_check) for w in to_evaluate]
+        for w, score in zip(to_evaluate, scores):
             # if w['class'] in tgt_classes:
             #     print(w, score)
             if score:
@@ -530,10 +640,93 @@ class WidgetUtil:
         similars.sort(key=lambda x: x[1], reverse=True)
         return similars
 
+    @staticmethod
+    def weighted_sim_upper_bound(new_widget, old_widget, use_stopwords=True, state_score=None):
+        """An upper bound of weighted_sim(new_widget, old_widget) given its exact activity score (state_score),
+        counting every attribute that can be compared at all as a perfect match.
+        -inf: weighted_sim is None; inf: weighted_sim has to be evaluated (e.g., it raises)
+        """
+        attrs = WidgetFeatures.ATTRS
+        f_new, f_old = WidgetFeatures.of(new_widget, use_stopwords), WidgetFeatures.of(old_widget, use_stopwords)
+        if not any(f_old.existed) or not any(f_new.existed):
+            return -math.inf
+        bound = 0
+        for i, attr in enumerate(attrs):
+            if attr in new_widget and attr in old_widget:
+                if f_new.tokens[i] is None or f_old.tokens[i] is None:
+                    return math.inf
+                if f_new.tokens[i] and f_old.tokens[i]:
+                    bound += 1  # the attribute weights are at most 1 (and sibling_text may count fully)
+        text_attrs = [attrs.index('text'), attrs.index('parent_text')]
+        cross_score = 0
+        for i1 in text_attrs:
+            for i2 in text_attrs:
+                if i1 != i2 and f_new.existed[i1] and f_old.existed[i2]:
+                    if f_new.tokens[i1] is None or f_old.tokens[i2] is None:
+                        return math.inf
+                    if f_new.tokens[i1] and f_old.tokens[i2]:
+                        cross_score = 1
+        bound += cross_score + (state_score if state_score else 0)
+        # weighted_sim averages at least the attribute scores and the state score (the cross check of cross_check
+        # only applies without any attribute score, which never happens); 1e-6: sentence similarity may be 1 + ulp
+        return bound / (len(attrs) + 1) + 1e-6
+
+    @staticmethod
+    def top_k_similar(widgets, src_event, k, use_stopwords=True, cross_check=False, batch=False):
+        """The k widgets with the highest weighted_sim to src_event, as [(widget, score)], identical to the first k
+        of the stably sorted result of most_similar. Widgets are scored in decreasing order of their upper bound
+        (weighted_sim_upper_bound) and the rest are skipped once the bound cannot beat the current k-th score.
+        """
+        if k <= 0:
+            return []
+        # the activity score is exact and shared by all the widgets of the same activity
+        f_src = WidgetFeatures.of(src_event, use_stopwords)
+        acts = [WidgetFeatures.of(w, use_stopwords).act_tokens for w in widgets]
+        if f_src.act_tokens is None:
+            act_to_score = {}
+        else:
+            distinct_acts = [act for act in dict.fromkeys(acts) if act is not None]
+            if batch:
+                act_scores = StrUtil.w2v_sent_sims([(f_src.act_tokens, act) for act in distinct_acts])
+            else:
+                act_scores = [StrUtil.w2v_sent_sim(f_src.act_tokens, act) for act in distinct_acts]
+            act_to_score = dict(zip(distinct_acts, act_scores))
+        bounds = []
+        for w, act in zip(widgets, acts):
+            if act in act_to_score:
+                bounds.append(WidgetUtil.weighted_sim_upper_bound(w, src_event, use_stopwords, act_to_score[act]))
+            else:
+                bounds.append(math.inf)
+        order = sorted(range(len(widgets)), key=lambda i: bounds[i], reverse=True)
+        heap = []  # (score, -idx) of the best k so far; heap[0] is the k-th, ties broken by the original order
+        chunk_size = max(k, 16) if batch else 1
+        pos = 0
+        while pos < len(order) and bounds[order[pos]] > -math.inf:
+            if len(heap) == k and bounds[order[pos]] < heap[0][0]:
+                break
+            chunk = order[pos:pos + chunk_size]
+            pos += len(chunk)
+            if batch:
+                scores = WidgetUtil.batch_weighted_sim([widgets[i] for i in chunk], src_event, use_stopwords, cross_check)
+            else:
+                scores = [WidgetUtil.weighted_sim(widgets[i], src_event, use_stopwords, cross_check) for i in chunk]
+            for i, score in zip(chunk, scores):
+                if score:
+                    if len(heap) < k:
+                        heapq.heappush(heap, (score, -i))
+                    elif (score, -i) > heap[0]:
+                        heapq.heapreplace(heap, (score, -i))
+        return [(widgets[-neg_i], score) for score, neg_i in sorted(heap, reverse=True)]
+
     @classmethod
     def get_nearest_button(cls, dom, w):
         # for now just return the first btn on the screen; todo: find the nearest button
-        soup = BeautifulSoup(dom, 'lxml-xml')
+        page = PageModel.of(dom)
+        btn = page.query('nearest_button', lambda: cls.get_first_button(page.get_soup()))
+        return btn.copy() if btn else btn
+
+    @classmethod
+    def get_first_button(cls, soup):
         for btn_class in ['android.widget.ImageButton', 'android.widget.Button', 'android.widget.EditText']:
             all_btns = soup.find_all(attrs={'class': btn_class})
             if all_btns and len(all_btns) > 0:
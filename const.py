@@ -3,6 +3,60 @@ CONFIG_FILE = 'config.csv'
 SA_INFO_FOLDER = 'sa_info'
 LOG_FOLDER = 'log'
 SNAPSHOT_FOLDER = 'snapshot'
+# record the device interactions of Explorer into TRACE_FOLDER/<config id>.jsonl.gz (see RecordingDriver.py)
+RECORD_TRACE = False
+TRACE_FOLDER = 'trace'
+# word2vec model: the binary from GoogleNews, or its gensim native conversion (.kv) which is memory-mapped
+# e.g., python SimEngine.py convert GoogleNews-vectors-negative300.bin GoogleNews-vectors-negative300.kv
+W2V_MODEL_PATH = './GoogleNews-vectors-negative300.bin'
+# with a vocabulary-restricted model (see Vocabulary.py) as W2V_MODEL_PATH, the full model to look up
+# the words that are not in the vocabulary; '' for no fallback
+W2V_FALLBACK_MODEL_PATH = ''
+# similarity backend: 'http' (query w2v_service.py) or 'local' (load W2V_MODEL_PATH in process)
+W2V_BACKEND = 'http'
+# address of w2v_service.py for the 'http' backend
+W2V_SERVICE_HOST = '127.0.0.1'
+W2V_SERVICE_PORT = 5000
+# score all the candidates of a source event with one request to w2v_service
+W2V_BATCH = True
+# shortlist this many candidates from widget_db by an approximate nearest-neighbour index (see WidgetIndex.py)
+# before scoring them exactly; 0 to score all the widgets (e.g., 300 for apps with thousands of widgets)
+W2V_INDEX_SHORTLIST = 0
+# among candidates of equal score, rank the widgets sharing a word with the source event first (see WidgetDB)
+W2V_LEXICAL_FIRST = False
+# GUI state signatures as pkg!act!layouts!leaves (the full index sequences, readable but long) instead of
+# pkg!act!digest; for caches keyed by the former signatures (also see WidgetUtil.migrate_gui_signature)
+GUI_SIGNATURE_LEGACY = False
+# bounds of WidgetUtil.state_to_widgets (the widgets of the visited GUI states, see StateCache.py)
+STATE_CACHE_SIZE = 500
+STATE_CACHE_BYTES = 100 * 2 ** 20
+# how Runner waits for the UI to settle after each action (see Settler.py): 'fixed' (sleep Runner.act_interval,
+# the reproducible baseline), 'adaptive' (opt-in: poll the activity and page source until they stop changing,
+# and compare the 'UI settle waits' stats of a run against 'fixed') or 'none' (e.g., with a FakeDriver)
+SETTLE_STRATEGY = 'fixed'
+# kind of wait -> (min, max) time in sec for the 'adaptive' strategy
+SETTLE_BOUNDS = {
+    'default': (0.5, 4),
+    'reset': (1, 8),  # after (re)launching the app
+    'click': (0.5, 4),
+    'long_press': (0.5, 4),
+    'swipe_right': (0.5, 4),
+    'send_keys': (0.3, 3),
+    'hide_keyboard': (0.2, 1),
+    'KEY_BACK': (0.5, 4),
+    'wait_until': (0, 2),  # the condition was already waited for
+    'EMPTY_EVENT': (0, 2),  # nothing was done
+    'end': (0.5, 4),  # at the end of Runner.perform_actions
+    'end_require_wait': (1, 8),
+}
+SETTLE_POLL_INTERVAL = 0.25
+# how Explorer brings the app back to the state after the tgt events (see StateRestorer.py): 'checkpoint' (from the
+# current state if it is on the way, verified by gui signature) or 'reset' (reset the app and replay all the events)
+STATE_RESTORE_POLICY = 'checkpoint'
+# number of gui signatures remembered for the 'checkpoint' policy
+STATE_RESTORE_CHECKPOINTS = 256
+# at most this many KEY_BACK presses to go back to a checkpoint
+STATE_RESTORE_MAX_BACK = 2
 # preference for staying at current state
 # SAFE VALUE: 0.037 (a21-a23-b21) <= threshold <= 0.045 (a52-a55-b51)
 # EXTRA_SCORE = 0.037
@@ -0,0 +1,40 @@
+import os
+import re
+import sys
+import hashlib
+import numpy as np
+import gensim
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# local import
+from SimBackend import SimBackend, LocalSimBackend
+
+
+def write_model(model_path, texts, vector_size=16):
+    # a small word2vec model of the words in texts, the same (random) vector for the same word regardless of case
+    words = sorted({w for t in texts for w in re.findall(r'[A-Za-z0-9]+', t)})
+    vectors = np.array([np.random.default_rng(int(hashlib.md5(w.lower().encode()).hexdigest()[:8], 16))
+                        .standard_normal(vector_size) for w in words], dtype=np.float32)
+    model = gensim.models.KeyedVectors(vector_size)
+    model.add_vectors(words, vectors)
+    model.save(model_path)
+
+
+@pytest.fixture
+def sim_backend(tmp_path):
+    """A local sim backend over a small model of the words of test_repo, for texts (more) in the test"""
+    texts = []
+    for folder, _, files in os.walk(os.path.join(ROOT, 'test_repo')):
+        for name in files:
+            if name.endswith('.json'):
+                with open(os.path.join(folder, name), encoding='utf-8') as f:
+                    texts.append(f.read())
+
+    def create(more_texts=()):
+        write_model(str(tmp_path / 'model.kv'), texts + list(more_texts))
+        SimBackend.instance = LocalSimBackend(str(tmp_path / 'model.kv'))
+        return SimBackend.instance
+    yield create
+    SimBackend.instance = None
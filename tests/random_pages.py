@@ -0,0 +1,67 @@
+import random
+from xml.sax.saxutils import quoteattr
+
+# random page sources, with the quirks of real ones (multi-word classes, entities, emojis, empty attributes) and
+# malformed ones (truncated, lone surrogates, control characters, unclosed elements)
+CLASSES = ['android.widget.EditText', 'android.widget.MultiAutoCompleteTextView', 'android.widget.TextView',
+           'android.widget.Button', 'android.widget.ImageButton', 'android.view.View', 'android.widget.LinearLayout',
+           'android.widget.RelativeLayout', 'android.widget.FrameLayout', 'TextInputLayout', 'android.widget.ListView',
+           'android.widget.TextView extra', 'L', 'a', 'T']
+TEXTS = ['Save', 'Log In', 'Sign up with Google', '15.0', 'a & b', '<x>', 'émoji 😀', '"q"', "it's", '', ' ',
+         'Percent %']
+RESOURCE_IDS = ['', 'com.x:id/btn_save', 'id/et_name', 'tv', 'a/b/c_d']
+
+
+def random_attrs(r, p_class):
+    attrs = {}
+    if r.random() < p_class:
+        attrs['class'] = r.choice(CLASSES)
+    for k in ['text', 'content-desc']:
+        if r.random() < 0.8:
+            attrs[k] = r.choice(TEXTS)
+    if r.random() < 0.8:
+        attrs['resource-id'] = r.choice(RESOURCE_IDS)
+    for k in ['enabled', 'clickable', 'password', 'naf']:
+        if r.random() < 0.85:
+            attrs[k] = r.choice(['true', 'false', 'true', ''])
+    return attrs
+
+
+def random_node(r, depth, out, indent, p_class):
+    attrs = random_attrs(r, p_class)
+    tag = attrs.get('class', 'node').split()[0] if r.random() < 0.5 else 'node'
+    attr_str = ' '.join(f'{k}={quoteattr(v)}' for k, v in attrs.items())
+    num_children = r.randint(0, 4) if depth < 6 else 0
+    newline = '\n' + '  ' * indent if indent is not None else ''
+    if not num_children:
+        out.append(f'{newline}<{tag} {attr_str}/>')
+    else:
+        out.append(f'{newline}<{tag} {attr_str}>')
+        for _ in range(num_children):
+            random_node(r, depth + 1, out, None if indent is None else indent + 1, p_class)
+        out.append(f'{newline}</{tag}>')
+
+
+def random_page(seed, p_class=0.95, malformed=True):
+    r = random.Random(seed)
+    out = ['<?xml version="1.0" encoding="UTF-8"?>' if r.random() < 0.7 else '']
+    indent = 0 if r.random() < 0.5 else None
+    if r.random() < 0.1:  # a widget as the root element
+        random_node(r, 5, out, indent, p_class)
+    else:
+        out.append('<hierarchy rotation="0">')
+        for _ in range(r.randint(1, 3)):
+            random_node(r, 0, out, indent, p_class)
+        out.append('</hierarchy>')
+    dom = ''.join(out)
+    if malformed:
+        variant = seed % 5
+        if variant == 0:
+            dom = dom[:r.randrange(len(dom))]
+        elif variant == 1:
+            dom = dom.replace('text="', 'text="Sa&#55357;&#56832;ve', 1)
+        elif variant == 2:
+            dom = dom.replace('text="', 'text="Sa\x01ve', 2)
+        elif variant == 3:
+            dom = dom.replace('</node>', '', 1)
+    return dom
@@ -0,0 +1,44 @@
+import os
+import glob
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, 'tests', 'fixtures')
+# local import
+from Explorer import Explorer
+from FakeDriver import FakeDriver
+from CallGraphParser import CallGraphParser
+from ResourceParser import ResourceParser
+from Configuration import Configuration
+
+CONFIG_ID = 'a21-a22-b21'
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch, sim_backend):
+    # Explorer reads config.csv, sa_info and test_repo, and writes its snapshots, relative to the working directory
+    for name in ['config.csv', 'sa_info', 'test_repo']:
+        os.symlink(os.path.join(ROOT, name), tmp_path / name)
+    os.mkdir(tmp_path / 'snapshot')
+    monkeypatch.chdir(tmp_path)
+    texts = []
+    for fpath in glob.glob(os.path.join(FIXTURES, 'a22', '*.xml')):
+        with open(fpath, encoding='utf-8') as f:
+            texts.append(f.read())
+    sim_backend(texts)
+    return tmp_path
+
+
+def test_explorer_runs_on_fake_driver(workdir):
+    config = Configuration(CONFIG_ID)
+    apk_folder = os.path.join('sa_info', CONFIG_ID.split('-')[1])
+    driver = FakeDriver.from_folder(os.path.join(FIXTURES, 'a22'), config.pkg_to, config.act_to,
+                                    CallGraphParser(apk_folder), ResourceParser(apk_folder), config.no_reset)
+    explorer = Explorer(CONFIG_ID, driver=driver)
+    is_done, failed_step = explorer.run()
+    assert is_done, f'failed at source index {failed_step}'
+    assert explorer.tgt_events
+    assert os.path.exists(os.path.join('snapshot', CONFIG_ID + '.pkl'))
+    # the learned events replay on the fake app
+    explorer.runner.perform_actions(explorer.tgt_events)
+    assert driver.current_package == config.pkg_to
@@ -0,0 +1,110 @@
+import random
+from collections import defaultdict
+# local import
+from Explorer import Explorer
+from WidgetUtil import WidgetUtil
+from WidgetRecord import WidgetRecord
+
+
+def dict_is_equal(w1, w2, ignore_activity=False):
+    # is_equal before the identity keys: the compared attributes one by one
+    if not w1 or not w2:
+        return False
+    keys = set(WidgetUtil.FEATURE_KEYS) - {'naf'}
+    if not ignore_activity:
+        keys |= {'package', 'activity'}
+    for k in keys:
+        if (k in w1) != (k in w2):
+            return False
+        if k in w1:
+            v1, v2 = w1[k], w2[k]
+            if k == 'resource-id':
+                v1, v2 = w1.get('id-prefix', '') + v1, w2.get('id-prefix', '') + v2
+            if v1 != v2:
+                return False
+    return True
+
+
+def dict_check_mapped(tgt_events, match):
+    for i, e in enumerate(tgt_events):
+        if e['class'] != 'android.widget.EditText' or 'send_keys' not in e['action'][0]:
+            continue
+        typed = dict(e)
+        typed['text'] = e['action'][1]
+        if dict_is_equal(match, e) or dict_is_equal(match, typed):
+            return i
+    return -1
+
+
+def dict_check_skipped(skipped, match):
+    for s in skipped:
+        typed = dict(s)
+        typed['text'] = s['action'][1]
+        if dict_is_equal(match, s) or dict_is_equal(match, typed):
+            return True
+    return False
+
+
+def random_widgets(r, num):
+    # few values, so that many widgets are equal, and resource-ids that are equal with or without id-prefix
+    widgets = [{}]
+    for _ in range(num):
+        w = {}
+        for k in WidgetUtil.FEATURE_KEYS + ['package', 'activity', 'id-prefix']:
+            if r.random() < 0.8:
+                w[k] = r.choice(['', 'a', 'b', 'a/', 'ab'])
+        if r.random() < 0.5:
+            w['class'] = 'android.widget.EditText'
+            w['action'] = ['send_keys', r.choice(['', 'a', 'b'])]
+        else:
+            w['action'] = ['click']
+        w.setdefault('class', 'x')
+        widgets.append(WidgetRecord.from_dict(w) if r.random() < 0.5 else w)
+    return widgets
+
+
+def test_identity_key_as_is_equal():
+    r = random.Random(0)
+    widgets = random_widgets(r, 500)
+    num_equal = 0
+    for _ in range(20000):
+        w1, w2 = r.choice(widgets), r.choice(widgets)
+        for ignore_activity in [False, True]:
+            expected = dict_is_equal(w1, w2, ignore_activity)
+            assert WidgetUtil.is_equal(w1, w2, ignore_activity) == expected, (w1, w2)
+            key1 = WidgetUtil.get_identity_key(w1, ignore_activity)
+            assert (key1 is not None and key1 == WidgetUtil.get_identity_key(w2, ignore_activity)) == expected
+            num_equal += expected
+    assert num_equal
+
+
+def test_check_mapped_and_skipped():
+    r = random.Random(1)
+    widgets = random_widgets(r, 500)
+    explorer = Explorer.__new__(Explorer)
+    explorer.mapped_index = None
+    explorer.current_src_index = 0
+    num_mapped = 0
+    for _ in range(50):
+        explorer.tgt_events = []
+        explorer.skipped_match = defaultdict(dict)
+        skipped = []
+        for _ in range(40):
+            p = r.random()
+            if p < 0.5:
+                explorer.tgt_events.append(r.choice(widgets[1:]))
+            elif p < 0.55:  # a new list, e.g., after a mismatch
+                explorer.tgt_events = explorer.tgt_events[:len(explorer.tgt_events) // 2]
+            elif p < 0.6:
+                e = r.choice(widgets[1:])
+                if e['class'] == 'android.widget.EditText':
+                    skipped.append(e)
+                    explorer.add_skipped_match(0, e)
+            explorer.idx_src_to_tgt = {i: i for i in range(len(explorer.tgt_events))}
+            for _ in range(5):
+                match = r.choice(widgets)
+                expected = dict_check_mapped(explorer.tgt_events, match)
+                assert explorer.check_mapped(match)[1] == expected, match
+                assert explorer.check_skipped(match) == dict_check_skipped(skipped, match), match
+                num_mapped += expected != -1
+    assert num_mapped
@@ -0,0 +1,65 @@
+import re
+import random
+from bs4 import BeautifulSoup
+# local import
+from WidgetUtil import WidgetUtil
+from random_pages import random_page
+
+
+def regex_locate_widget(dom, criteria):
+    # locate_widget before the compiled XPaths: a regex per criterion (the value escaped for '+' and '?' only)
+    regex_criteria = {}
+    for k, v in criteria.items():
+        if v:
+            v = v.replace('+', r'\+').replace('?', r'\?')
+            regex_criteria[k] = re.compile(f'{v}$' if k == 'resource-id' else v)
+    if not regex_criteria:
+        return None
+    soup = BeautifulSoup(dom, 'lxml-xml')
+    return WidgetUtil.get_widget_from_soup_element(soup.find(attrs=regex_criteria))
+
+
+def run(f, *args):
+    try:
+        return f(*args)
+    except Exception as excep:
+        return type(excep).__name__
+
+
+def random_criteria(r, dom, num):
+    # criteria from the attributes of elements of the page (whole values, or parts of them), and one not found
+    elements = BeautifulSoup(dom, 'lxml-xml').find_all(True)
+    criteria = []
+    for _ in range(num if elements else 0):
+        attrs = r.choice(elements).attrs
+        c = {}
+        for k in r.sample(['class', 'text', 'resource-id', 'content-desc', 'clickable'], r.randint(1, 3)):
+            v = attrs.get(k, '')
+            if v and r.random() < 0.5:
+                i = r.randrange(len(v))
+                v = v[i:] if k == 'resource-id' else v[i:i + r.randint(1, 6)]
+            c[k] = v
+        criteria.append(c)
+    criteria.append({'text': 'nothing like this'})
+    # the regexes treat the other special characters as patterns, the locators match them literally
+    return [c for c in criteria if not any(ch in ''.join(c.values()) for ch in '.^$*{}[]()|\\')]
+
+
+def test_same_widget_as_regex_locate():
+    num_found = 0
+    for seed in range(100):
+        # a class for the root, as the widgets right under it read the class of their parent
+        dom = random_page(seed).replace('<hierarchy rotation="0">', '<hierarchy rotation="0" class="h">')
+        for criteria in random_criteria(random.Random(seed), dom, 8):
+            expected = run(regex_locate_widget, dom, criteria)
+            assert run(WidgetUtil.locate_widget, dom, criteria) == expected, (dom, criteria)
+            num_found += expected is not None and not isinstance(expected, str)
+    assert num_found  # not only widgets not found
+
+
+def test_special_characters_match_literally():
+    dom = '<hierarchy rotation="0" class="h"><node class="android.widget.Button" text="Total (15.0)" enabled="true" ' \
+          'resource-id="com.x:id/btn_total" clickable="true" /></hierarchy>'
+    assert WidgetUtil.locate_widget(dom, {'text': '(15.0)'})['resource-id'] == 'btn_total'
+    assert WidgetUtil.locate_widget(dom, {'text': '15.00'}) is None
+    assert WidgetUtil.locate_widget(dom, {'resource-id': 'btn_tot'}) is None  # a suffix of the resource-id
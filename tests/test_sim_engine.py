@@ -0,0 +1,45 @@
+import random
+import pytest
+# local import
+from SimCache import SimCache
+from SimEngine import SimEngine
+
+WORDS = ['save', 'Save', 'SAVE', 'note', 'notes', 'add', 'new', 'task', 'delete', 'cancel', 'ok', 'name', 'email',
+         'password', 'sign', 'log', 'in', 'settings']
+OOV_WORDS = ['qwxz', 'Qwxz', 'zzkv']
+
+
+def random_pairs(seed, num):
+    # sentences of words in and out of the model, with case variants and repeated words
+    r = random.Random(seed)
+    return [tuple([r.choice(WORDS + OOV_WORDS) for _ in range(r.randint(0, 6))] for _ in range(2))
+            for _ in range(num)]
+
+
+@pytest.fixture
+def model(sim_backend):
+    return sim_backend(WORDS + OOV_WORDS[2:]).engine.model
+
+
+def test_vectorized_as_pairwise_greedy_sim(model):
+    engine = SimEngine(model)
+    pairs = random_pairs(0, 2000)
+    num_scores = 0
+    for (s_new, s_old), score in zip(pairs, engine.w2v_sent_sims(pairs)):
+        expected = engine.w2v_sent_greedy_sim(s_new, s_old)
+        assert (score is None) == (expected is None), (s_new, s_old)
+        if score is not None:
+            assert score == pytest.approx(expected, abs=1e-6), (s_new, s_old)
+            num_scores += 1
+    assert num_scores
+
+
+def test_same_scores_with_cache(model, tmp_path):
+    pairs = random_pairs(1, 500)
+    expected = SimEngine(model).w2v_sent_sims(pairs)
+    cache = SimCache(str(tmp_path / 'sim_cache.db'))
+    engine = SimEngine(model, cache)
+    assert engine.w2v_sent_sims(pairs[:250]) == expected[:250]  # cold cache
+    assert engine.w2v_sent_sims(pairs) == expected  # partly cached
+    cache.flush()
+    assert SimEngine(model, SimCache(str(tmp_path / 'sim_cache.db'))).w2v_sent_sims(pairs) == expected
@@ -0,0 +1,43 @@
+import os
+import json
+import pickle
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# local import
+from Explorer import Explorer
+from WidgetDB import WidgetDB
+from WidgetUtil import WidgetUtil
+from WidgetRecord import WidgetRecord
+from Configuration import Configuration
+from ResourceParser import ResourceParser
+
+CONFIG_ID = 'a21-a22-b21'
+
+
+def test_load_snapshot_from_before_widget_db(monkeypatch):
+    # the state of an Explorer pickled before WidgetDB, WidgetRecord and the identity keys: plain dicts and lists
+    monkeypatch.chdir(ROOT)
+    config = Configuration(CONFIG_ID)
+    with open(os.path.join('test_repo', 'a2', 'b21', 'base', 'a21.json'), encoding='utf-8') as f:
+        src_events = json.load(f)
+    widgets = [WidgetRecord.to_dict(w) for w in ResourceParser(os.path.join('sa_info', 'a22')).get_widgets()
+               if w['activity']]
+    widget_db = {WidgetUtil.get_widget_signature(w): w for w in widgets}
+    explorer = Explorer.__new__(Explorer)
+    explorer.__dict__.update({
+        'config': config, 'runner': None, 'src_events': src_events, 'tid': CONFIG_ID, 'current_src_index': 0,
+        'tgt_events': [], 'f_target': 0, 'prev_tgt_events': [], 'f_prev_target': -1, 'widget_db': widget_db,
+        'invalid_events': defaultdict(list, {0: [widgets[0]]}), 'nearest_button_to_text': None,
+        'idx_src_to_tgt': {}, 'skipped_match': defaultdict(list, {0: [widgets[1]]}),
+        'consider_naf_only_widget': False})
+
+    loaded = pickle.loads(pickle.dumps(explorer))
+    assert isinstance(loaded.widget_db, WidgetDB)
+    assert list(loaded.widget_db.keys()) == list(widget_db.keys())
+    assert all(isinstance(w, WidgetRecord) for w in loaded.widget_db.values())
+    candidates = loaded.get_candidates(src_events[0])
+    assert [WidgetUtil.get_widget_signature(w) for w in candidates.values()] == list(widget_db.keys())
+    assert WidgetUtil.get_identity_key(widgets[0]) in loaded.invalid_events[0]
+    assert loaded.check_skipped(widgets[1])
+    assert not loaded.check_skipped(widgets[0])
@@ -0,0 +1,75 @@
+# local import
+from StateRestorer import CheckpointRestorer
+
+
+class StackRunner:
+    """A runner of an app where each click opens a screen of its text, and an event with a text starting with
+    'type' enters text on the current screen
+    """
+    def __init__(self):
+        self.stack = []
+        self.restorer = CheckpointRestorer(self, 10, 2)
+        self.num_resets = 0
+        self.num_end_waits = 0
+
+    def perform_actions(self, action_list, require_wait=False, reset=True, cgp=None):
+        self.restorer.begin_actions()
+        if reset:
+            self.stack = []
+            self.num_resets += 1
+        navigations = []
+        for e in action_list:
+            navigations.append(not e['text'].startswith('type'))
+            if navigations[-1]:
+                self.stack.append(e['text'])
+        self.restorer.end_actions(action_list, reset, navigations)
+
+    def settle_end(self, require_wait):
+        self.num_end_waits += 1
+
+    def press_back(self):
+        if self.stack:
+            self.stack.pop()
+
+    def get_page_source(self):
+        return f'<hierarchy><node class="{".".join(self.stack)}"/></hierarchy>'
+
+    def get_current_package(self):
+        return 'p'
+
+    def get_current_activity(self):
+        return '.'.join(self.stack)
+
+
+def event(text):
+    return {'class': 'android.widget.Button', 'text': text, 'action': ['click']}
+
+
+def test_restore_by_back_and_suffix():
+    runner = StackRunner()
+    tgt_events = [event('a'), event('b')]
+    for i in range(3):
+        runner.restorer.restore(tgt_events)
+        assert runner.stack == ['a', 'b']
+        runner.perform_actions([event(f'candidate{i}')], reset=False)  # validating a candidate
+    runner.restorer.restore(tgt_events + [event('c')])
+    assert runner.stack == ['a', 'b', 'c']
+    assert runner.num_resets == 1
+    assert runner.restorer.counts['back'] == 2 and runner.restorer.counts['back+suffix'] == 1
+
+
+def test_reset_instead_of_back_over_text_or_to_the_start():
+    runner = StackRunner()
+    runner.restorer.restore([event('a')])
+    runner.perform_actions([event('type text')], reset=False)
+    runner.restorer.restore([event('a')])  # back cannot undo the text entered
+    assert runner.num_resets == 2
+    runner.restorer.restore([event('b')])  # only the app data reset restores the start
+    assert runner.num_resets == 3 and runner.stack == ['b']
+
+
+def test_settle_when_staying():
+    runner = StackRunner()
+    runner.restorer.restore([event('a')])
+    runner.restorer.restore([event('a')], require_wait=True)
+    assert runner.restorer.counts['stay'] == 1 and runner.num_end_waits == 1
@@ -0,0 +1,33 @@
+import os
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# local import
+from WidgetDB import WidgetDB
+from WidgetUtil import WidgetUtil
+from Benchmark import Benchmark
+
+
+@pytest.fixture
+def workload(monkeypatch, sim_backend):
+    monkeypatch.chdir(ROOT)
+    workload = Benchmark.load_workload()  # the transfers in config.csv
+    # the words of the static widgets are in the model too
+    sim_backend([str(v) for _, _, widgets in workload for w in widgets for v in w.values()])
+    return workload
+
+
+@pytest.mark.parametrize('k', [1, 3, 10])
+def test_top_k_as_first_k_of_full_result(workload, k):
+    num_results = 0
+    for config, src_events, widgets in workload:
+        db = WidgetDB(config.use_stopwords)
+        for w in widgets:
+            db[WidgetUtil.get_widget_signature(w)] = w
+        for src_event in src_events:
+            for candidates in [widgets, db]:
+                args = (src_event, candidates, config.use_stopwords, config.expand_btn_to_text, config.cross_check)
+                full = WidgetUtil.most_similar(*args, batch=True)
+                assert WidgetUtil.most_similar(*args, batch=True, k=k) == full[:k], (config.id, src_event)
+                num_results += len(full)
+    assert num_results
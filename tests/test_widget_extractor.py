@@ -0,0 +1,40 @@
+import pytest
+from bs4 import BeautifulSoup
+# local import
+from WidgetUtil import WidgetUtil
+from WidgetExtractor import WidgetExtractor
+from random_pages import random_page
+
+
+def soup_widgets(dom):
+    # find_all_widgets before WidgetExtractor: find_all per widget class over a BeautifulSoup tree
+    soup = BeautifulSoup(dom, 'lxml-xml')
+    widgets = []
+    for w_class in WidgetUtil.WIDGET_CLASSES:
+        for e in soup.find_all(attrs={'class': w_class}):
+            d = WidgetUtil.get_widget_from_soup_element(e)
+            if d:
+                widgets.append(d)
+    return widgets
+
+
+def extracted_widgets(dom):
+    return WidgetExtractor(WidgetUtil.WIDGET_CLASSES, WidgetUtil.FEATURE_KEYS).extract(dom)
+
+
+def run(f, dom):
+    try:
+        return f(dom)
+    except Exception as excep:  # e.g., KeyError for a widget right under the root element
+        return type(excep).__name__
+
+
+@pytest.mark.parametrize('p_class', [0.95, 0.5])
+def test_same_widgets_as_beautifulsoup(p_class):
+    num_widgets = 0
+    for seed in range(200):
+        dom = random_page(seed, p_class)
+        expected = run(soup_widgets, dom)
+        assert run(extracted_widgets, dom) == expected, dom
+        num_widgets += len(expected) if isinstance(expected, list) else 0
+    assert num_widgets  # not only empty pages
@@ -0,0 +1,63 @@
+import pickle
+import random
+from copy import deepcopy
+import pytest
+# local import
+from WidgetRecord import WidgetRecord
+
+KEYS = ['class', 'resource-id', 'text', 'action', 'stepping_events', 'score', 'extra', 'other-key']
+
+
+def random_value(r):
+    return r.choice(['Save', '', 'android.widget.Button', None, 0.5, ['click'], ['send_keys', 'abc'],
+                     [{'class': 'android.widget.Button', 'text': 'OK', 'action': ['click']}]])
+
+
+def check_same(w, d):
+    assert w == d and d == w
+    assert len(w) == len(d)
+    assert sorted(w) == sorted(d)
+    assert WidgetRecord.to_dict(w) == d
+    for k in KEYS:
+        assert (k in w) == (k in d)
+        assert w.get(k) == d.get(k) and w.get(k, 'default') == d.get(k, 'default')
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_same_as_dict(seed):
+    # random operations on a record and on a dict, the record has to behave as the dict
+    r = random.Random(seed)
+    w, d = WidgetRecord(), {}
+    for _ in range(200):
+        op, k = r.choice(['set', 'set', 'del', 'pop', 'update', 'copy']), r.choice(KEYS)
+        if op == 'set':
+            v = random_value(r)
+            w[k], d[k] = v, deepcopy(v)
+        elif op == 'del':
+            if k in d:
+                del w[k], d[k]
+            else:
+                with pytest.raises(KeyError):
+                    del w[k]
+        elif op == 'pop':
+            assert w.pop(k, 'missing') == d.pop(k, 'missing')
+        elif op == 'update':
+            more = {r.choice(KEYS): random_value(r) for _ in range(2)}
+            w.update(more)
+            d.update(deepcopy(more))
+        else:
+            w = r.choice([w.copy(), deepcopy(w), pickle.loads(pickle.dumps(w)), WidgetRecord.from_dict(d)])
+        check_same(w, d)
+
+    # copies are independent of the record, except for the values of a shallow copy
+    shallow, deep, frozen = w.copy(), deepcopy(w), w.snapshot()
+    shallow['text'] = deep['text'] = 'changed'
+    check_same(w, d)
+    if isinstance(w.get('action'), list):
+        deep['action'].append('x')
+        assert w['action'] == d['action']
+        assert shallow['action'] is w['action']
+    assert WidgetRecord.to_dict(frozen) == d
+    assert pickle.loads(pickle.dumps(frozen)) == frozen
+    with pytest.raises(TypeError):
+        frozen['text'] = 'changed'
@@ -1,34 +1,74 @@
 from flask import Flask, request
 from flask_restful import Api, Resource, reqparse
-import gensim
-import pickle
+from werkzeug.serving import make_server
+from concurrent.futures import Future
+import argparse
+import threading
+import socket
+import signal
+import atexit
+import sys
 import os
+# local import
+from SimCache import SimCache
+from SimEngine import SimEngine
+from const import W2V_MODEL_PATH, W2V_FALLBACK_MODEL_PATH, W2V_SERVICE_HOST, W2V_SERVICE_PORT
+
+pkl_path = "./w2v_sim_cache.pkl"  # legacy cache, imported once into the db of the model it was computed with
+legacy_model = 'GoogleNews-vectors-negative300'  # that model (.bin, or its .kv conversion), float32, no fallback
+db_path = "./w2v_sim_cache.db"  # one per model, see SimCache.get_db_path
+# the model is loaded once, before forking workers, so all workers share it (read-only)
+engine = SimEngine(SimEngine.load_model(W2V_MODEL_PATH), fallback_model_path=W2V_FALLBACK_MODEL_PATH)
+
+
+class Coalescer:
+    """Concurrent identical requests are computed once; the others wait for the result"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = {}  # key -> Future
+        self.num_coalesced = 0
+
+    def do(self, key, fn):
+        with self.lock:
+            future = self.in_flight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = self.in_flight[key] = Future()
+            else:
+                self.num_coalesced += 1
+        if not is_leader:
+            return future.result()
+        try:
+            future.set_result(fn())
+        except Exception as excep:
+            future.set_exception(excep)
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+        return future.result()
+
+
+coalescer = Coalescer()
 
-model = gensim.models.KeyedVectors.load_word2vec_format('./GoogleNews-vectors-negative300.bin', binary=True)
-cached_sim = dict()
-pkl_path = "./w2v_sim_cache.pkl"
 
-if os.path.exists(pkl_path ):
-    with open(pkl_path , 'rb') as f:
-        cached_sim = pickle.load(f)
+def w2v_sent_sim(s_new, s_old):
+    key = ('w2v', tuple(s_new), tuple(s_old))
+    return coalescer.do(key, lambda: engine.w2v_sent_sim(s_new, s_old))
 
 
-def w2v_sim(w_from, w_to):
-    if (w_from, w_to) in cached_sim:
-        return cached_sim[(w_from, w_to)]
-    elif (w_to, w_from) in cached_sim:
-        return cached_sim[(w_to, w_from)]
-    else:
-        if w_from.lower() == w_to.lower():
-            sim = 1.0
-        elif w_from in model.key_to_index and w_to in model.key_to_index:
-            sim = model.similarity(w1=w_from, w2=w_to)
-        else:
-            sim = None
-        cached_sim[(w_from, w_to)] = sim
-        with open(pkl_path , 'wb') as f:
-            pickle.dump(cached_sim, f)
-        return sim
+def w2v_sent_sims(pairs):
+    key = ('w2v_batch', tuple((tuple(s_new), tuple(s_old)) for s_new, s_old in pairs))
+    return coalescer.do(key, lambda: engine.w2v_sent_sims(pairs))
+
+
+def init_worker():
+    # sqlite connections must not be shared across processes, so each worker opens its own
+    dtype = engine.model.vectors.dtype
+    is_legacy_model = os.path.splitext(os.path.basename(W2V_MODEL_PATH))[0] == legacy_model \
+        and dtype == 'float32' and not W2V_FALLBACK_MODEL_PATH
+    engine.cache = SimCache(SimCache.get_db_path(db_path, W2V_MODEL_PATH, W2V_FALLBACK_MODEL_PATH, dtype),
+                            legacy_pkl_path=pkl_path if is_legacy_model else None)
+    atexit.register(engine.cache.close)
 
 
 '''
@@ -59,29 +99,6 @@ def w2v_sent_sim(s_new, s_old):
 '''
 
 
-def w2v_sent_sim(s_new, s_old):
-    # calculate the similarity score matrix
-    scores = []
-    valid_new_words = set()
-    valid_old_words = set(s_old)
-    for w1 in s_new:
-        for w2 in valid_old_words:
-            sim = w2v_sim(w1, w2)
-            if sim:
-                valid_new_words.add(w1)
-                scores.append((w1, w2, sim))
-    scores = sorted(scores, key=lambda x: x[2], reverse=True)
-    counted = []
-    for new_word, old_word, score in scores:
-        if new_word in valid_new_words and old_word in valid_old_words:
-            valid_new_words.remove(new_word)
-            valid_old_words.remove(old_word)
-            counted.append(score)
-        if not valid_new_words or not valid_old_words:
-            break
-    return sum(counted) / len(counted) if counted else None
-
-
 class WordSim(Resource):
     def get(self):
         return {'error': 'Non-supported HTTP Method'}, 200
@@ -98,8 +115,96 @@ class WordSim(Resource):
         return {'error': 'Non-supported HTTP Method'}, 200
 
 
-if __name__ == '__main__':
+class WordSimBatch(Resource):
+    # one request for all the sentence pairs needed to score a source widget against many candidates
+    def get(self):
+        return {'error': 'Non-supported HTTP Method'}, 200
+
+    def post(self):
+        args = request.json
+        sent_sims = w2v_sent_sims(args['pairs'])
+        return {'sent_sims': sent_sims}, 200
+
+    def put(self):
+        return {'error': 'Non-supported HTTP Method'}, 200
+
+    def delete(self):
+        return {'error': 'Non-supported HTTP Method'}, 200
+
+
+class WordVec(Resource):
+    # sentence embeddings for WidgetIndex
+    def get(self):
+        return {'error': 'Non-supported HTTP Method'}, 200
+
+    def post(self):
+        args = request.json
+        vecs = engine.sent_vecs(args['sents'])
+        return {'vecs': vecs.tolist()}, 200
+
+    def put(self):
+        return {'error': 'Non-supported HTTP Method'}, 200
+
+    def delete(self):
+        return {'error': 'Non-supported HTTP Method'}, 200
+
+
+def create_app():
     app = Flask(__name__)
     api = Api(app)
     api.add_resource(WordSim, '/w2v')  # e.g., '/w2v/<string:w1>/<string:w2>'
-    app.run(debug=True)
+    api.add_resource(WordSimBatch, '/w2v_batch')  # e.g., {'pairs': [[s_new, s_old], ...]}
+    api.add_resource(WordVec, '/w2v_vec')  # e.g., {'sents': [s, ...]}
+    return app
+
+
+def serve_workers(app, host, port, workers):
+    """Pre-fork workers, each a threaded server accepting on the same listening socket"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    pids = []
+    for i in range(workers):
+        pid = os.fork()
+        if pid == 0:  # worker
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+            init_worker()
+            server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                engine.cache.close()
+                os._exit(0)
+        pids.append(pid)
+    print(f'Serving on http://{host}:{port} with {workers} workers (pids: {pids})')
+    try:
+        for pid in pids:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+
+if __name__ == '__main__':
+    # python w2v_service.py --workers 4
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default=W2V_SERVICE_HOST)
+    parser.add_argument('--port', type=int, default=W2V_SERVICE_PORT)
+    parser.add_argument('--workers', type=int, default=1, help='number of processes (requires os.fork)')
+    parser.add_argument('--debug', action='store_true', help='Flask development server with reloader')
+    args = parser.parse_args()
+    app = create_app()
+    if args.debug:
+        init_worker()
+        app.run(host=args.host, port=args.port, debug=True)
+    elif args.workers > 1 and hasattr(os, 'fork'):
+        serve_workers(app, args.host, args.port, args.workers)
+    else:
+        init_worker()
+        app.run(host=args.host, port=args.port, threaded=True)